@@ -1,44 +1,92 @@
 import streamlit as st
 from google.cloud import firestore
-import time
+import threading
 from datetime import datetime
 
-# Firestore setup
-db = firestore.Client.from_service_account_json("firebase-key.json")
-
 st.set_page_config(page_title="Hospital ER Dashboard", layout="wide")
 st.title("🚑 Hospital Emergency Room Dashboard")
 
-REFRESH_INTERVAL = 5  # seconds
-
-if "last_refresh" not in st.session_state:
-    st.session_state.last_refresh = 0
-if "seen_ids" not in st.session_state:
-    st.session_state.seen_ids = set()
-    # Preload all current IDs so old accidents don’t flash
-    initial_docs = db.collection("accident_data").stream()
-    for doc in initial_docs:
-        st.session_state.seen_ids.add(doc.id)
-
-def fetch_accidents():
-    # Newest accidents at the top
-    docs = db.collection("accident_data").order_by(
-        "time", direction=firestore.Query.DESCENDING
-    ).stream()
-    accidents = []
-    for doc in docs:
+PAGE_SIZE = 25  # accidents per window (live window and each older page)
+
+
+# Local copy of accident_data shared by every session. A snapshot listener on
+# the newest PAGE_SIZE accidents keeps it current, receiving only the documents
+# that change. Older history is pulled a page at a time.
+class AccidentCache:
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.accidents = {}
+        self.ready = threading.Event()
+        self.oldest_time = None
+        self.exhausted = False
+
+        query = db.collection("accident_data").order_by(
+            "time", direction=firestore.Query.DESCENDING
+        ).limit(PAGE_SIZE)
+        self.watch = query.on_snapshot(self.on_snapshot)
+        self.ready.wait(timeout=10)
+
+    def on_snapshot(self, docs, changes, read_time):
+        with self.lock:
+            for change in changes:
+                # REMOVED only means the document slid out of the live window
+                if change.type.name != "REMOVED":
+                    self.store(change.document)
+        self.ready.set()
+
+    def store(self, doc):
         data = doc.to_dict()
         data["id"] = doc.id
-        accidents.append(data)
-    return accidents
+        self.accidents[doc.id] = data
 
-def update_field(doc_id, field, value):
-    db.collection("accident_data").document(doc_id).update({field: value})
+        ts = data.get("time")
+        if ts is not None and (self.oldest_time is None or ts < self.oldest_time):
+            self.oldest_time = ts
+
+    def load_older(self):
+        # One windowed query past the oldest accident held locally
+        if self.oldest_time is None:
+            return
+
+        docs = self.db.collection("accident_data").order_by(
+            "time", direction=firestore.Query.DESCENDING
+        ).start_after({"time": self.oldest_time}).limit(PAGE_SIZE).stream()
+
+        count = 0
+        with self.lock:
+            for doc in docs:
+                self.store(doc)
+                count += 1
+        self.exhausted = count < PAGE_SIZE
+
+    def apply(self, doc_id, changes):
+        with self.lock:
+            if doc_id in self.accidents:
+                self.accidents[doc_id].update(changes)
+
+    def newest_first(self):
+        with self.lock:
+            accidents = [dict(accident) for accident in self.accidents.values()]
+        return sorted(accidents, key=lambda a: (a.get("time") is not None, a.get("time") or 0), reverse=True)
 
-# Auto-refresh
-if time.time() - st.session_state.last_refresh > REFRESH_INTERVAL:
-    st.session_state.accidents = fetch_accidents()
-    st.session_state.last_refresh = time.time()
+
+@st.cache_resource
+def get_cache():
+    # Firestore setup
+    db = firestore.Client.from_service_account_json("firebase-key.json")
+    return AccidentCache(db)
+
+
+cache = get_cache()
+
+if "seen_ids" not in st.session_state:
+    # Whatever is already cached when the session opens is not new
+    st.session_state.seen_ids = {accident["id"] for accident in cache.newest_first()}
+
+def update_field(doc_id, field, value):
+    cache.db.collection("accident_data").document(doc_id).update({field: value})
+    cache.apply(doc_id, {field: value})
 
 # Color scheme with flash
 def get_status_color(accident, is_new=False):
@@ -60,6 +108,12 @@ def format_location(geo):
     except Exception:
         return "Unknown"
 
+def format_hospital(hospital):
+    if not hospital:
+        return "N/A"
+    meters = hospital.get("road_distance_m", hospital.get("distance_m", 0))
+    return f"{hospital.get('name', 'Unknown')} ({meters / 1000:.1f} km)"
+
 def format_time(ts):
     try:
         dt = ts if isinstance(ts, datetime) else ts.to_datetime()
@@ -68,52 +122,55 @@ def format_time(ts):
         return str(ts)
 
 # Render accidents as cards
-if "accidents" in st.session_state:
-    for accident in st.session_state.accidents:
-        is_new = accident["id"] not in st.session_state.seen_ids
-        bg_color = get_status_color(accident, is_new)
-
-        # Card container
-        with st.container():
-            st.markdown(
-                f"""
-                <div style="
-                    background-color:{bg_color};
-                    padding:15px;
-                    border-radius:12px;
-                    margin-bottom:5px;
-                    box-shadow:0px 2px 5px rgba(0,0,0,0.15);
-                    transition: background-color 2s ease;
-                ">
-                    <b>ACCIDENT</b><br>
-                    • <b>Time:</b> {format_time(accident.get('time'))}<br>
-                    • <b>Location:</b> {format_location(accident.get('location'))}<br>
-                    • <b>Severity:</b> {accident.get('severity', 'N/A')}<br>
-                    • <b>AI Confidence:</b> {accident.get('ai_conf', 'N/A')}<br>
-                    • <b>ER Informed:</b> {accident.get('er_informed', False)}<br>
-                    • <b>ER Dispatched:</b> {accident.get('er_dispatched', False)}<br>
-                    • <b>Patient Recovered:</b> {accident.get('patient_rec', False)}<br>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-            # Buttons below each card
-            if not accident.get("er_dispatched", False):
-                if st.button("🚑 Dispatched", key=f"dispatch_{accident['id']}"):
-                    update_field(accident["id"], "er_dispatched", True)
-                    st.success("Marked as Dispatched ✅")
-                    st.session_state.accidents = fetch_accidents()
-                    st.rerun()
-
-            elif accident.get("er_dispatched", False) and not accident.get("patient_rec", False):
-                if st.button("✅ Patient Recovered", key=f"recovered_{accident['id']}"):
-                    update_field(accident["id"], "patient_rec", True)
-                    st.success("Patient marked as Recovered 🎉")
-                    st.session_state.accidents = fetch_accidents()
-                    st.rerun()
-
-            st.markdown("---")  # separator between cards
-
-        # Mark accident as seen (so it won’t flash next refresh)
-        st.session_state.seen_ids.add(accident["id"])
+for accident in cache.newest_first():
+    is_new = accident["id"] not in st.session_state.seen_ids
+    bg_color = get_status_color(accident, is_new)
+
+    # Card container
+    with st.container():
+        st.markdown(
+            f"""
+            <div style="
+                background-color:{bg_color};
+                padding:15px;
+                border-radius:12px;
+                margin-bottom:5px;
+                box-shadow:0px 2px 5px rgba(0,0,0,0.15);
+                transition: background-color 2s ease;
+            ">
+                <b>ACCIDENT</b><br>
+                • <b>Time:</b> {format_time(accident.get('time'))}<br>
+                • <b>Location:</b> {format_location(accident.get('location'))}<br>
+                • <b>Severity:</b> {accident.get('severity', 'N/A')}<br>
+                • <b>Nearest Hospital:</b> {format_hospital(accident.get('nearest_hospital'))}<br>
+                • <b>AI Confidence:</b> {accident.get('ai_conf', 'N/A')}<br>
+                • <b>ER Informed:</b> {accident.get('er_informed', False)}<br>
+                • <b>ER Dispatched:</b> {accident.get('er_dispatched', False)}<br>
+                • <b>Patient Recovered:</b> {accident.get('patient_rec', False)}<br>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+
+        # Buttons below each card
+        if not accident.get("er_dispatched", False):
+            if st.button("🚑 Dispatched", key=f"dispatch_{accident['id']}"):
+                update_field(accident["id"], "er_dispatched", True)
+                st.success("Marked as Dispatched ✅")
+                st.rerun()
+
+        elif accident.get("er_dispatched", False) and not accident.get("patient_rec", False):
+            if st.button("✅ Patient Recovered", key=f"recovered_{accident['id']}"):
+                update_field(accident["id"], "patient_rec", True)
+                st.success("Patient marked as Recovered 🎉")
+                st.rerun()
+
+        st.markdown("---")  # separator between cards
+
+    # Mark accident as seen (so it won’t flash next refresh)
+    st.session_state.seen_ids.add(accident["id"])
+
+if not cache.exhausted:
+    if st.button("Load older accidents"):
+        cache.load_older()
+        st.rerun()
@@ -5,16 +5,16 @@ File: accident.py
 Author(s): Aashrith Srinivasa.
 License: See LICENSE file in the repository for full terms.
 Description:
-    Monitors accident events from shared data, logs accident information
+    Waits for new detection snapshots from shared data, logs accident information
     including severity and AI confidence to Firestore, and resets
-    accident status after logging.
+    accident status after logging. With a recorder.ClipRecorder, a clip
+    of the moments around each accident is saved and linked to its record.
+    The nearest hospitals (hospital.py) are looked up once when the thread
+    starts and attached to every accident record.
 ================================================================================
 """
 
 
-# TODO: Implement algorithm to find nearest hospital
-# TODO: Log nearest hospital along with accident info
-
 import time
 import datetime
 import logging as log
@@ -22,48 +22,78 @@ import logging as log
 from firebase_admin.firestore import GeoPoint, SERVER_TIMESTAMP
 
 import database
+import metrics
+import hospital
+from state import StateStore
 
 
 lat, lng = 12.312735, 76.583278
-tick = 0.1
 
 active_accident = False
 last_no_accident_time = time.time()
 gap_time = 5
+real_confidence = 25
+
+accidents_logged = metrics.Counter("traffiq_accidents_logged_total", "Accidents written to the database")
+
+
+def hospital_records(lat, lng):
+    nearest = hospital.nearest_hospitals(lat, lng)
+    for entry in nearest:
+        entry["location"] = GeoPoint(entry.pop("lat"), entry.pop("lng"))
 
+    if nearest:
+        log.info(f"Nearest Hospital: {nearest[0]['name']} ({nearest[0]['distance_m']} m)")
+    return nearest
 
-def run(shared_data: dict, lock):
+
+def new_accident(data, now=None):
+    # True when this snapshot starts an accident; replay.py passes the
+    # log's time as `now`
     global active_accident, last_no_accident_time
-    data = None
+
+    if data["accident"]["accident"]:
+        if not active_accident:
+            active_accident = True
+            return True
+
+    elif active_accident:
+        last_no_accident_time = time.time() if now is None else now
+        active_accident = False
+
+    return False
+
+
+def accident_record(data, hospitals=()):
+    data_pack = {
+        "time": SERVER_TIMESTAMP,
+        "location": GeoPoint(lat, lng),
+        "severity": "major" if data["accident"]["accident_count"] > 1 else "minor",
+        "ai_conf": data["accident"]["ai_confidence"],
+        "er_informed": False,
+        "er_dispatched": False,
+        "real": data["accident"]["ai_confidence"] > real_confidence
+    }
+    if hospitals:
+        data_pack["nearest_hospital"] = hospitals[0]
+        data_pack["nearest_hospitals"] = hospitals
+    return data_pack
+
+
+def run(shared_data: StateStore, recorder=None):
+    version = 0
+
+    # Fixed per intersection, so none of it is done on the alert path
+    hospitals = hospital_records(lat, lng)
 
 
     while True:
-        time.sleep(tick)
-        with lock:
-            if shared_data != data:
-                data = shared_data.copy()
-
-        severity = "major" if data["accident"]["accident_count"] > 1 else "minor"
-
-        if data["accident"]["accident"]:
-            if not active_accident:
-                data_pack = {
-                    "time": SERVER_TIMESTAMP,
-                    "location": GeoPoint(lat, lng),
-                    "severity": severity,
-                    "ai_conf": data["accident"]["ai_confidence"],
-                    "er_informed": False,
-                    "er_dispatched": False,
-                    "real": data["accident"]["ai_confidence"] > 25
-                }
-
-                document_id = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S") + f"_{lat}_{lng}"
-                database.write_data("accident_data", document_id, data_pack)
-                log.info("Auto-Logged Accident Data")
-
-                active_accident = True
-                
-        else:
-            if active_accident:
-                last_no_accident_time = time.time()
-                active_accident = False
+        version, data = shared_data.wait(version)
+
+        if new_accident(data):
+            document_id = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S") + f"_{lat}_{lng}"
+            database.write_data("accident_data", document_id, accident_record(data, hospitals))
+            log.info("Auto-Logged Accident Data")
+            accidents_logged.inc()
+            if recorder is not None:
+                recorder.trigger(document_id)
@@ -14,6 +14,14 @@ Description:
     Based on the received command, the corresponding LED pin is set HIGH or LOW.
     A confirmation message with the affected pin and status is sent back 
     over the serial connection.
+
+    Also accepts a whole-intersection frame "$<SEQ><STATES>*<CHECKSUM>", where:
+        - SEQ     : two hex digits, echoed back in the reply
+        - STATES  : one digit per signal unit starting at A, the bits
+                    being 1 = Red, 2 = Yellow, 4 = Green
+        - CHECKSUM: two hex digits, XOR of every character between '$' and '*'
+    The frame is validated completely before any LED is changed, then
+    "ACK <SEQ>" or "NAK <SEQ>" is sent back.
 ================================================================================
 */
 
@@ -54,11 +62,58 @@ void setup() {
 }
 
 
+// Applies a whole-intersection frame in one go. See the header for the format.
+void handleFrame(String frame) {
+  int star = frame.indexOf('*');
+  String seq = frame.substring(1, 3);
+
+  if (star < 4 || frame.length() != star + 3) {
+    Serial.println("NAK " + seq);
+    return;
+  }
+
+  byte checksum = 0;
+  for (int i = 1; i < star; i++) {
+    checksum ^= frame.charAt(i);
+  }
+
+  byte expected = (byte) strtol(frame.substring(star + 1).c_str(), NULL, 16);
+  int units = min(star - 3, 3);
+  if (checksum != expected) {
+    Serial.println("NAK " + seq);
+    return;
+  }
+
+  // Validate every unit before touching any LED
+  for (int i = 0; i < units; i++) {
+    int bits = frame.charAt(3 + i) - '0';
+    if (bits < 0 || bits > 7) {
+      Serial.println("NAK " + seq);
+      return;
+    }
+  }
+
+  for (int i = 0; i < units; i++) {
+    int bits = frame.charAt(3 + i) - '0';
+    for (int j = 0; j < 3; j++) {
+      digitalWrite(LED_PINS[i][j], (bits >> j) & 1 ? HIGH : LOW);
+    }
+  }
+
+  Serial.println("ACK " + seq);
+}
+
+
 void loop() {
   if (Serial.available() > 0) {
     String command = Serial.readStringUntil('\n'); // Read incoming string until newline
     command.trim(); // Remove any leading/trailing whitespace
 
+    if (command.startsWith("$")) {
+      handleFrame(command);
+      return;
+    }
+
     // Get the required characters to identify the signal unit and color from the command
     char signal_char = command.charAt(0);
     char color_char = command.charAt(2);
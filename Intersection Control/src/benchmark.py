@@ -0,0 +1,355 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: benchmark.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Offline replay and benchmark harness. Runs the same capture, inference,
+    traffic, accident and websocket pipeline as main.py against a video
+    file or a directory of frames, with a pluggable detector, a fake
+    Arduino and an in-memory Firestore, and prints FPS, per-stage latency
+    percentiles and dropped frames as JSON.
+
+    Usage:
+        python benchmark.py clip.mp4 --detector random --fps 0
+        python benchmark.py frames/ --detector onnx --model ../custom_yolo.onnx --output bench.json
+================================================================================
+"""
+
+
+import os
+import json
+import time
+import queue
+import asyncio
+import argparse
+import tempfile
+import threading
+import logging as log
+
+import cv2
+import numpy
+import websockets
+
+import main
+import camera
+import traffic
+import accident
+import database
+import density
+import webserver
+from state import StateStore, initial_state
+from serial_link import SignalLink
+from intersection import IntersectionRegistry
+from detector import BACKENDS, Detector, RoiDetector, create_detector, empty_detections, Detections
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FileSource:
+    # cv2.VideoCapture look-alike over a video file or a frame directory.
+    # Paced to `fps`; with fps 0 it waits for the pipeline to take each
+    # frame, which measures raw throughput without dropping anything.
+    def __init__(self, path, fps=None, slot=None, loops=1):
+        self.path = path
+        self.slot = slot
+        self.loops = loops
+        self.files = None
+        self.video = None
+
+        if os.path.isdir(path):
+            self.files = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            native_fps = 30.0
+        else:
+            self.video = cv2.VideoCapture(path)
+            native_fps = self.video.get(cv2.CAP_PROP_FPS) or 30.0
+
+        self.fps = native_fps if fps is None else fps
+        self.index = 0
+        self.next_time = time.perf_counter()
+        self.ahead = self.next_frame()
+
+    def isOpened(self):
+        # One frame is read ahead so the end of the source is not an error
+        return self.ahead[0]
+
+    def next_frame(self):
+        if self.files is not None:
+            if self.index >= len(self.files) * self.loops:
+                return False, None
+            frame = cv2.imread(self.files[self.index % len(self.files)])
+            self.index += 1
+            return frame is not None, frame
+
+        success, frame = self.video.read()
+        if not success and self.loops > 1:
+            self.loops -= 1
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.video.read()
+        return success, frame
+
+    def read(self, image=None):
+        if self.fps:
+            delay = self.next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + 1 / self.fps, time.perf_counter() - 1 / self.fps)
+
+        elif self.slot is not None:
+            with self.slot.cond:
+                self.slot.cond.wait_for(lambda: self.slot.read_seq == self.slot.seq or self.slot.closed)
+
+        (success, frame), self.ahead = self.ahead, self.next_frame()
+        if success and image is not None and image.shape == frame.shape:
+            image[...] = frame
+            frame = image
+        return success, frame
+
+    def release(self):
+        if self.video is not None:
+            self.video.release()
+
+
+class RandomDetector:
+    # Stub detector: a fixed number of random boxes, no model cost
+    def __init__(self, count=40, accident_rate=0.01, seed=0):
+        self.names = {0: "accident", 1: "objects"}
+        self.count = count
+        self.accident_rate = accident_rate
+        self.rng = numpy.random.default_rng(seed)
+
+    def __call__(self, frame):
+        height, width = frame.shape[:2]
+        corners = self.rng.uniform((0, 0), (width - 80, height - 80), (self.count, 2))
+        sizes = self.rng.uniform(20, 80, (self.count, 2))
+        boxes = numpy.hstack([corners, corners + sizes]).astype(numpy.float32)
+        classes = (self.rng.random(self.count) >= self.accident_rate).astype(numpy.float32)
+        confs = self.rng.uniform(0.3, 1.0, self.count).astype(numpy.float32)
+        return Detections(boxes, classes, confs)
+
+
+class NullDetector:
+    def __init__(self):
+        self.names = {0: "accident", 1: "objects"}
+
+    def __call__(self, frame):
+        return empty_detections()
+
+
+DETECTORS = {
+    "none": lambda args: NullDetector(),
+    "random": lambda args: RandomDetector(args.boxes),
+    **{
+        backend: lambda args, backend=backend: create_detector(backend, args.model, args.imgsz, args.threads)
+        for backend in BACKENDS
+    }
+}
+
+
+class FakeArduino:
+    # Serial-like device that acknowledges every signal frame
+    def __init__(self):
+        self.replies = queue.Queue()
+        self.frames = 0
+
+    def write(self, data):
+        line = data.decode().strip()
+        if line.startswith("$"):
+            self.frames += 1
+            self.replies.put(f"ACK {line[1:3]}\r\n".encode())
+        return len(data)
+
+    def readline(self):
+        try:
+            return self.replies.get(timeout=0.1)
+        except queue.Empty:
+            return b""
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryDocument:
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self.id = key[1]
+
+
+class MemoryBatch:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    def set(self, ref, data):
+        self.ops.append((ref.key, data, False))
+
+    def update(self, ref, data):
+        self.ops.append((ref.key, data, True))
+
+    def commit(self):
+        for key, data, merge in self.ops:
+            if merge:
+                self.store.documents.setdefault(key, {}).update(data)
+            else:
+                self.store.documents[key] = dict(data)
+        self.store.commits += 1
+
+
+class MemoryCollection:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def document(self, document_id):
+        return MemoryDocument(self.store, (self.name, document_id))
+
+
+class MemoryFirestore:
+    # Just enough of the Firestore client for database.py
+    def __init__(self):
+        self.documents = {}
+        self.commits = 0
+
+    def collection(self, name):
+        return MemoryCollection(self, name)
+
+    def batch(self):
+        return MemoryBatch(self)
+
+
+def run_viewer(port, stop):
+    # Local websocket client that subscribes to the video stream
+    async def view():
+        async with websockets.connect(f"ws://127.0.0.1:{port}") as websocket:
+            await websocket.send(json.dumps({"type": "start_video"}))
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(websocket.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    pass
+
+    time.sleep(0.5)
+    asyncio.run(view())
+
+
+def summarize(samples):
+    values = numpy.asarray(samples) * 1000
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(numpy.percentile(values, 50)), 3),
+        "p90_ms": round(float(numpy.percentile(values, 90)), 3),
+        "p99_ms": round(float(numpy.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+
+def run(args):
+    main.headless = True
+    main.motion_gating = args.motion_gate
+    main.tracking = not args.no_track
+    main.motion_min_rate = args.min_rate
+    registry = IntersectionRegistry(args.intersection, (main.frame_height, main.frame_width, 3))
+    registry.watch()
+    regions = registry.get().regions
+    shared_data = StateStore(initial_state(regions))
+
+    firestore = MemoryFirestore()
+    database.spool_path = os.path.join(tempfile.mkdtemp(prefix="traffiq_bench_"), "spool.db")
+    database.init(client=firestore)
+    arduino = FakeArduino()
+    traffic.arduino = SignalLink(device=arduino)
+
+    detector = DETECTORS[args.detector](args)
+    if args.roi:
+        detector = RoiDetector(detector, regions, (main.frame_height, main.frame_width, 3))
+    if isinstance(detector, (Detector, RoiDetector)):
+        detector.warmup((main.frame_height, main.frame_width, 3))
+    threading.Thread(target=traffic.run, args=(shared_data, registry), daemon=True).start()
+    threading.Thread(target=accident.run, args=(shared_data,), daemon=True).start()
+    threading.Thread(target=density.run, args=(shared_data, registry), daemon=True).start()
+
+    stop = threading.Event()
+    if args.viewers:
+        threading.Thread(target=webserver.run, args=("127.0.0.1", args.port, shared_data), daemon=True).start()
+        for _ in range(args.viewers):
+            threading.Thread(target=run_viewer, args=(args.port, stop), daemon=True).start()
+        time.sleep(1)
+
+    frame_slot = camera.LatestFrame()
+    source = FileSource(args.source, args.fps, frame_slot, args.loops)
+    cap_thread = threading.Thread(target=camera.run, args=(source, frame_slot), daemon=True)
+
+    detection_log = main.open_detection_log(args.detection_log, detector.names, (main.frame_height, main.frame_width, 3)) if args.detection_log else None
+
+    timings = {}
+    start = time.perf_counter()
+    cap_thread.start()
+    main.run_pipeline(frame_slot, detector, registry, shared_data, timings, detection_log=detection_log)
+    duration = time.perf_counter() - start
+    if detection_log is not None:
+        detection_log.close()
+
+    stop.set()
+    cap_thread.join(timeout=2)
+    source.release()
+    traffic.close_arduino()
+    database.close()
+
+    processed = len(timings.get("wait", []))
+    inferences = len(timings.get("inference", []))
+    return {
+        "source": args.source,
+        "detector": args.detector,
+        "viewers": args.viewers,
+        "frames_captured": frame_slot.seq,
+        "frames_processed": processed,
+        "frames_dropped": frame_slot.dropped,
+        "inferences": inferences,
+        "skip_ratio": round(1 - inferences / processed, 4) if processed else 0.0,
+        "duration_s": round(duration, 3),
+        "fps": round(processed / duration, 2) if duration else 0.0,
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+        "signal_frames": arduino.frames,
+        "database_writes": len(firestore.documents)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TraffIQ offline replay benchmark")
+    parser.add_argument("source", help="video file or directory of frames")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="random")
+    parser.add_argument("--model", default="../custom_yolo.pt", help="model for the inference backends")
+    parser.add_argument("--imgsz", type=int, default=640, help="model input size")
+    parser.add_argument("--threads", type=int, default=0, help="inference threads, 0 = backend default")
+    parser.add_argument("--boxes", type=int, default=40, help="boxes per frame for the random detector")
+    parser.add_argument("--fps", type=float, default=None, help="replay rate, 0 = as fast as possible (default: source rate)")
+    parser.add_argument("--roi", action="store_true", help="run the model only on crops around the regions")
+    parser.add_argument("--intersection", help="intersection config file, hot-reloaded during the run")
+    parser.add_argument("--motion-gate", action="store_true", help="skip inference on frames without motion")
+    parser.add_argument("--min-rate", type=float, default=1.0, help="minimum inferences per second with --motion-gate")
+    parser.add_argument("--no-track", action="store_true", help="skip the vehicle tracker")
+    parser.add_argument("--detection-log", help="folder to log the detections in, for replay.py")
+    parser.add_argument("--loops", type=int, default=1, help="play the source this many times")
+    parser.add_argument("--viewers", type=int, default=0, help="local websocket viewers to attach")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    log.getLogger().setLevel(log.WARNING)
+    report = json.dumps(run(args), indent=2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    else:
+        print(report)
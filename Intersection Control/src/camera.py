@@ -0,0 +1,110 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: camera.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Camera capture stage. Reads frames on a dedicated thread and keeps only
+    the newest one in a single-slot buffer, dropping frames the inference
+    stage did not get to, so detections never lag behind the camera.
+
+    Given a frame_buffer.SharedFrameBuffer, frames are decoded straight into
+    its shared memory slots, so stages in other processes can read them
+    without a copy.
+================================================================================
+"""
+
+
+import threading
+import logging as log
+
+import cv2
+
+import metrics
+
+
+frames_captured = metrics.Counter("traffiq_frames_captured_total", "Frames read from the capture source")
+frames_dropped = metrics.Counter("traffiq_frames_dropped_total", "Captured frames overwritten before inference took them")
+capture_read = metrics.stage("capture")
+
+
+class LatestFrame:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.read_seq = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame, seq=None):
+        # `seq`: the frame's SharedFrameBuffer sequence number, if it has one
+        with self.cond:
+            if self.seq > self.read_seq:
+                self.dropped += 1
+                frames_dropped.inc()
+
+            self.frame = frame
+            self.seq = self.seq + 1 if seq is None else seq
+            self.cond.notify_all()
+
+    def get(self, timeout=None):
+        # Blocks until a frame newer than the last one read is available.
+        # Returns (None, None) once the slot is closed and drained.
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > self.read_seq or self.closed, timeout)
+            if self.seq == self.read_seq:
+                return None, None
+
+            self.read_seq = self.seq
+            self.cond.notify_all()
+            return self.seq, self.frame
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+def open_capture(source, width, height):
+    capture = cv2.VideoCapture(source, cv2.CAP_DSHOW)
+    capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+def run(capture, slot: LatestFrame, frames=None):
+    try:
+        while capture.isOpened() and not slot.closed:
+            seq = None
+            with capture_read.time():
+                if frames is None:
+                    success, frame = capture.read()
+
+                else:
+                    seq, view = frames.begin_write()
+                    success, frame = capture.read(view)
+                    if success and frame is not view:
+                        # The source ignored the buffer (different size or type)
+                        height, width = frame.shape[:2]
+                        view[:height, :width] = frame
+                        frame = view[:height, :width]
+                    if success:
+                        frames.end_write(seq)
+
+            if not success:
+                log.error("Failed to read frame")
+                break
+
+            frames_captured.inc()
+            slot.put(frame, seq)
+
+    except Exception:
+        log.exception("Unexpected exception in capture thread")
+
+    finally:
+        slot.close()
+        log.info(f"Capture Stopped. Dropped {slot.dropped} Frames")
@@ -0,0 +1,128 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: controller.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Signal controllers for traffic.run. A controller answers two questions
+    from the latest shared_data snapshot:
+        green_time(region, data, elapsed): seconds of green to give `region`,
+            which has already been green for `elapsed` seconds (0 when its
+            green is just starting, more when it is being extended).
+        next_green(region, data, elapsed): the region to serve when the
+            current green runs out; returning `region` itself extends it.
+
+    "fixed" is the original rule: round-robin, 9 s of green with more than
+    one vehicle waiting, 4 s otherwise. "pressure" is a max-pressure style
+    actuated controller: it serves the approach with the most pressure,
+    skips approaches with nothing waiting and extends a busy green in
+    short steps between `min_green` and `max_green`.
+
+    "fixed_time" ignores the counts altogether and cycles with equal greens.
+    DegradedController runs that plan while the detector is still starting
+    and hands over to the configured controller once it is ready.
+
+    simulate.py benchmarks the controllers against each other offline.
+================================================================================
+"""
+
+
+def positive(name, value):
+    # traffic.run sleeps for these; zero or less would spin it
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+        raise ValueError(f"{name} must be a positive number, got {value!r}")
+    return value
+
+
+class FixedController:
+    def __init__(self, region_names):
+        self.order = list(region_names)
+
+    def green_time(self, region, data, elapsed=0.0):
+        return 9 if data["vehicle"].get(region, 0) > 1 else 4
+
+    def next_green(self, region, data, elapsed=0.0):
+        return self.order[(self.order.index(region) + 1) % len(self.order)]
+
+
+class FixedTimeController:
+    def __init__(self, region_names, green=10):
+        self.order = list(region_names)
+        self.green = positive("green", green)
+
+    def green_time(self, region, data, elapsed=0.0):
+        return self.green
+
+    def next_green(self, region, data, elapsed=0.0):
+        return self.order[(self.order.index(region) + 1) % len(self.order)]
+
+
+class PressureController:
+    def __init__(self, region_names, min_green=5, max_green=40, extension=2, wait_weight=0.1):
+        self.order = list(region_names)
+        self.min_green = positive("min_green", min_green)
+        self.max_green = positive("max_green", max_green)
+        self.extension = positive("extension", extension)
+        if max_green < min_green:
+            raise ValueError(f"max_green {max_green} is below min_green {min_green}")
+        if isinstance(wait_weight, bool) or not isinstance(wait_weight, (int, float)) or wait_weight < 0:
+            raise ValueError(f"wait_weight must be a number of at least 0, got {wait_weight!r}")
+        self.wait_weight = wait_weight
+
+    def pressure(self, region, data):
+        # Stopped vehicles count twice, and a long average wait adds to it so
+        # a lightly used approach is not starved by two busy ones
+        flow = data.get("flow", {}).get(region, {})
+        return (
+            data["vehicle"].get(region, 0) + flow.get("queue", 0)
+            + self.wait_weight * flow.get("wait", 0.0)
+        )
+
+    def green_time(self, region, data, elapsed=0.0):
+        return self.min_green if elapsed == 0 else self.extension
+
+    def next_green(self, region, data, elapsed=0.0):
+        # Other approaches in round-robin order from the current one, so ties
+        # go to whoever is next in line
+        start = self.order.index(region)
+        others = [self.order[(start + i) % len(self.order)] for i in range(1, len(self.order))]
+        waiting = [(self.pressure(other, data), other) for other in others]
+        waiting = [(pressure, other) for pressure, other in waiting if pressure > 0]
+        if not waiting:
+            return region
+
+        best_pressure, best = max(waiting, key=lambda entry: entry[0])
+        current = self.pressure(region, data)
+        if elapsed < self.max_green and current > 0 and current >= best_pressure:
+            return region
+        return best
+
+
+class DegradedController:
+    # `ready`: threading.Event set once detections are being published
+    def __init__(self, controller, fallback, ready):
+        self.controller = controller
+        self.fallback = fallback
+        self.ready = ready
+
+    def active(self):
+        return self.controller if self.ready.is_set() else self.fallback
+
+    def green_time(self, region, data, elapsed=0.0):
+        return self.active().green_time(region, data, elapsed)
+
+    def next_green(self, region, data, elapsed=0.0):
+        return self.active().next_green(region, data, elapsed)
+
+
+CONTROLLERS = {
+    "fixed": FixedController,
+    "fixed_time": FixedTimeController,
+    "pressure": PressureController
+}
+
+
+def create_controller(name, region_names, timing=None):
+    # `timing`: the intersection config's timing, keyed by controller name
+    return CONTROLLERS[name](region_names, **(timing or {}).get(name, {}))
@@ -8,28 +8,75 @@ Author(s):
 License: See LICENSE file in the repository for full terms.
 Description:
     Provides Firestore initialization and helper functions to write and 
-    update documents in collections. Handles error logging for database
-    operations.
+    update documents in collections. Writes are queued without blocking
+    the caller and committed in batches by a background writer. While
+    Firestore is unreachable they are spooled to a local SQLite file and
+    replayed once it comes back; a write Firestore rejects outright (not
+    found, invalid, too large, not permitted) is dropped on its own.
 ================================================================================
 """
 
 
 from sys import exit
+import json
+import time
+import queue
+import sqlite3
+import datetime
+import threading
 import logging as log
 
 import firebase_admin
 import google.auth.exceptions
 import google.api_core.exceptions
 from firebase_admin import firestore, exceptions as fb_exceptions
+from firebase_admin.firestore import GeoPoint, SERVER_TIMESTAMP
+
+import metrics
 
 
 file_path = "../firebase-key.json"
+spool_path = "../firestore_spool.db"
+batch_size = 50
+flush_interval = 2.0
+retry_interval = 30.0
+
+database = None
+write_queue = queue.Queue()
+writer_thread = None
+last_flush_latency = 0.0
+spooled = 0
+
+flush_time = metrics.stage("firestore_flush")
+writes_committed = metrics.Counter("traffiq_firestore_writes_total", "Firestore writes by outcome", {"result": "committed"})
+writes_spooled = metrics.Counter("traffiq_firestore_writes_total", "Firestore writes by outcome", {"result": "spooled"})
+writes_dropped = metrics.Counter("traffiq_firestore_writes_total", "Firestore writes by outcome", {"result": "dropped"})
+metrics.Gauge("traffiq_firestore_queue_depth", "Writes waiting for the background writer", fn=lambda: write_queue.qsize())
+metrics.Gauge("traffiq_firestore_spooled", "Writes held in the local spool", fn=lambda: spooled)
+
 
+# Errors after which the same write can succeed later. Anything else is
+# Firestore rejecting the write itself, which no retry will change.
+RETRYABLE = (
+    google.api_core.exceptions.ServiceUnavailable,
+    google.api_core.exceptions.DeadlineExceeded,
+    google.api_core.exceptions.InternalServerError,
+    google.api_core.exceptions.ResourceExhausted,
+    google.api_core.exceptions.Aborted,
+    google.api_core.exceptions.RetryError,
+    google.auth.exceptions.TransportError,
+    ConnectionError,
+    TimeoutError
+)
 
-def init():
-    global database
+
+def init(client=None):
+    global database, writer_thread
     try: 
-        if not firebase_admin._apps:
+        if client is not None:
+            database = client
+
+        elif not firebase_admin._apps:
             credential = firebase_admin.credentials.Certificate(file_path)
             firebase_admin.initialize_app(credential=credential)
             database = firestore.client()
@@ -57,35 +104,241 @@ def init():
     except Exception as e:
         log.critical(f"Unexpected exception during Firestore init: {e}")
         exit(3)
-    
+
+    if writer_thread is None:
+        writer_thread = threading.Thread(target=run_writer, daemon=True)
+        writer_thread.start()
+
+
+def close():
+    # Flushes whatever is queued; anything that cannot be committed stays spooled.
+    if writer_thread is not None:
+        write_queue.put(None)
+        writer_thread.join(timeout=10)
+
+
+def queue_depth():
+    return write_queue.qsize()
+
 
 def write_data(collection : str, document_id : str, data : dict):
-    try:
+    write_queue.put(("set", collection, document_id, data, time.time()))
+
+
+def update_data(collection: str, document_id : str, data : dict):
+    write_queue.put(("update", collection, document_id, data, time.time()))
+
+
+def encode_value(value, queued_at):
+    # Spooled records are stored as JSON, so Firestore types are tagged.
+    # A server timestamp is pinned to the time the record was queued,
+    # otherwise a replay hours later would stamp the replay time.
+    if value is SERVER_TIMESTAMP:
+        return {"$time": queued_at}
+    if isinstance(value, GeoPoint):
+        return {"$geo": [value.latitude, value.longitude]}
+    if isinstance(value, datetime.datetime):
+        return {"$time": value.timestamp()}
+    if isinstance(value, dict):
+        return {key: encode_value(item, queued_at) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item, queued_at) for item in value]
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if "$time" in value:
+            return datetime.datetime.fromtimestamp(value["$time"], datetime.timezone.utc)
+        if "$geo" in value:
+            return GeoPoint(*value["$geo"])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+def commit(records):
+    batch = database.batch()
+    for op, collection, document_id, data, _ in records:
         doc_ref = database.collection(collection).document(document_id)
-        doc_ref.set(data)
-        log.info(f"Wrote data to {collection}/{doc_ref.id}")
-    
-    except google.api_core.exceptions.GoogleAPIError as e:
-        log.error(f"Firestore API error during write: {e}")
+        if op == "set":
+            batch.set(doc_ref, data)
+        else:
+            batch.update(doc_ref, data)
+    batch.commit()
 
-    except Exception as e:
-        log.error(f"Failed to write to {collection}/{document_id}: {e}")
 
+def commit_each(records):
+    # Fallback when a batch is rejected (e.g. an update targets a missing
+    # document): commit one by one and drop only the rejected records.
+    # Returns (committed count, records left uncommitted by an outage).
+    committed = 0
+    for i, record in enumerate(records):
+        try:
+            commit([record])
+            committed += 1
 
-def update_data(collection: str, document_id : str, data : dict):
+        except RETRYABLE as e:
+            log.error(f"Firestore commit failed, {len(records) - i} writes left: {e}")
+            return committed, records[i:]
+
+        except google.api_core.exceptions.NotFound:
+            log.error(f"Document {record[1]}/{record[2]} not found. Dropping {record[0]}.")
+            writes_dropped.inc()
+
+        except Exception as e:
+            log.error(f"Firestore rejected {record[0]} of {record[1]}/{record[2]}. Dropping it: {e}")
+            writes_dropped.inc()
+
+    return committed, []
+
+
+def spool(connection, records):
+    global spooled
     try:
-        doc_ref = database.collection(collection).document(document_id)
-        doc_ref.update(data)
-        log.info(f"Updated {collection}/{document_id} with {data}")
+        connection.executemany(
+            "INSERT INTO spool (op, collection, document_id, data) VALUES (?, ?, ?, ?)",
+            [(op, collection, document_id, json.dumps(encode_value(data, queued_at)))
+             for op, collection, document_id, data, queued_at in records]
+        )
+        connection.commit()
+        spooled = connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
 
-    except google.api_core.exceptions.NotFound:
-        log.error(f"Document {collection}/{document_id} not found.")
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        # A full disk or a value JSON cannot hold must not stop the writer
+        connection.rollback()
+        log.error(f"Could not spool {len(records)} Firestore writes, dropping them: {e}")
+        writes_dropped.inc(len(records))
+        return
 
-    except google.api_core.exceptions.GoogleAPIError as e:
-        log.error(f"Firestore API error during update: {e}")
-        
-    except Exception as e:
-        log.error(f"Failed to update {collection}/{document_id}: {e}")
+    writes_spooled.inc(len(records))
+    log.warning(f"Spooled {len(records)} Firestore writes locally ({spooled} pending)")
+
+
+def replay(connection):
+    # Drains the spool oldest first. Returns False if Firestore is still
+    # unreachable or the spool cannot be read, so it is retried later.
+    try:
+        return replay_batches(connection)
+
+    except sqlite3.Error as e:
+        log.error(f"Could not replay the Firestore spool: {e}")
+        return False
+
+
+def replay_batches(connection):
+    global spooled
+    while True:
+        rows = connection.execute(
+            "SELECT id, op, collection, document_id, data FROM spool ORDER BY id LIMIT ?", (batch_size,)
+        ).fetchall()
+        if not rows:
+            spooled = 0
+            return True
+
+        records = [(op, collection, document_id, decode_value(json.loads(data)), None)
+                   for _, op, collection, document_id, data in rows]
+        try:
+            commit(records)
+
+        except RETRYABLE as e:
+            log.error(f"Firestore still unreachable, {spooled} writes remain spooled: {e}")
+            return False
+
+        except Exception:
+            _, left = commit_each(records)
+            if left:
+                # Rows ahead of the failure were committed or dropped
+                done = len(rows) - len(left)
+                if done:
+                    connection.execute("DELETE FROM spool WHERE id <= ?", (rows[done - 1][0],))
+                    connection.commit()
+                spooled = connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+                log.error(f"Firestore still unreachable, {spooled} writes remain spooled")
+                return False
+
+        connection.execute("DELETE FROM spool WHERE id <= ?", (rows[-1][0],))
+        connection.commit()
+        spooled = connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        log.info(f"Replayed {len(rows)} spooled Firestore writes")
+
+
+def flush(connection, records, online):
+    global last_flush_latency
+    if not online:
+        spool(connection, records)
+        return False
+
+    start = time.perf_counter()
+    try:
+        commit(records)
+        writes_committed.inc(len(records))
+        log.info(f"Committed {len(records)} Firestore writes")
+
+    except RETRYABLE as e:
+        log.error(f"Firestore batch commit failed: {e}")
+        spool(connection, records)
+        return False
+
+    except Exception:
+        # One bad write rejects the whole batch; the others still go through
+        committed, left = commit_each(records)
+        writes_committed.inc(committed)
+        if left:
+            spool(connection, left)
+            return False
+
+    finally:
+        last_flush_latency = time.perf_counter() - start
+        flush_time.observe(last_flush_latency)
+
+    return True
+
+
+def run_writer():
+    global spooled
+    connection = sqlite3.connect(spool_path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS spool "
+        "(id INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT, collection TEXT, document_id TEXT, data TEXT)"
+    )
+    spooled = connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    online = replay(connection) if spooled else True
+    last_retry = time.time()
+    pending = []
+    deadline = None
+    stopping = False
+
+    while not stopping:
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        if not online:
+            timeout = min(timeout or retry_interval, max(0.0, last_retry + retry_interval - time.time()))
+
+        try:
+            record = write_queue.get(timeout=timeout)
+            if record is None:
+                stopping = True
+            else:
+                pending.append(record)
+                deadline = deadline or time.time() + flush_interval
+
+        except queue.Empty:
+            pass
+
+        if not online and time.time() - last_retry >= retry_interval:
+            online = replay(connection)
+            last_retry = time.time()
+
+        if pending and (stopping or len(pending) >= batch_size or time.time() >= deadline):
+            online = flush(connection, pending, online)
+            if not online:
+                last_retry = time.time()
+            pending = []
+            deadline = None
+
+    connection.close()
 
 
 def get_intersection_data():
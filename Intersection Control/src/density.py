@@ -0,0 +1,178 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: density.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Streaming traffic density rollups. Every change of the vehicle counts in
+    shared data is folded into the current window of each resolution
+    (1 min, 15 min and 1 h by default, aligned to the clock). The counts
+    hold until the next change, so the statistics are time-weighted: min,
+    max, mean, p50 / p90 and vehicle-seconds per region and in total. A
+    window is a few arrays (a histogram of seconds spent at each count
+    gives the percentiles, widened when a count does not fit), so memory
+    grows with the largest count seen, not with the number of updates. Finer windows are merged into coarser ones as they
+    close.
+
+    Each closed window becomes one compact document in traffic_data, with
+    its `resolution` in seconds and the mean total as `density`, which is
+    what the dashboards plot.
+================================================================================
+"""
+
+
+import time
+import datetime
+import logging as log
+
+import numpy
+from firebase_admin.firestore import GeoPoint
+
+import database
+import traffic
+from state import StateStore
+from intersection import IntersectionRegistry
+
+
+resolutions = (60, 900, 3600)
+histogram_bins = 64
+
+
+class Window:
+    # One row per region plus a last row for the total
+    def __init__(self, rows, bins):
+        self.hist = numpy.zeros((rows, bins))
+        self.minimum = numpy.full(rows, numpy.inf)
+        self.maximum = numpy.zeros(rows)
+        self.area = numpy.zeros(rows)
+        self.covered = 0.0
+
+    def reset(self):
+        self.hist[:] = 0
+        self.minimum[:] = numpy.inf
+        self.maximum[:] = 0
+        self.area[:] = 0
+        self.covered = 0.0
+
+    def fit(self, count):
+        # Widened (doubling) to hold `count`, so a busy junction's
+        # percentiles are never cut off at the last bin
+        bins = self.hist.shape[1]
+        if count >= bins:
+            while count >= bins:
+                bins *= 2
+            self.hist = numpy.pad(self.hist, ((0, 0), (0, bins - self.hist.shape[1])))
+
+    def add(self, counts, seconds):
+        self.fit(int(counts.max()))
+        self.hist[numpy.arange(len(counts)), counts] += seconds
+        numpy.minimum(self.minimum, counts, out=self.minimum)
+        numpy.maximum(self.maximum, counts, out=self.maximum)
+        self.area += counts * seconds
+        self.covered += seconds
+
+    def merge(self, other):
+        self.fit(other.hist.shape[1] - 1)
+        self.hist[:, :other.hist.shape[1]] += other.hist
+        numpy.minimum(self.minimum, other.minimum, out=self.minimum)
+        numpy.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.area += other.area
+        self.covered += other.covered
+
+    def percentile(self, q):
+        cumulative = self.hist.cumsum(axis=1)
+        return (cumulative >= q / 100 * self.covered - 1e-9).argmax(axis=1)
+
+    def summary(self, names):
+        mean = self.area / self.covered
+        p50, p90 = self.percentile(50), self.percentile(90)
+        return {
+            name: {
+                "min": int(self.minimum[i]),
+                "max": int(self.maximum[i]),
+                "mean": round(float(mean[i]), 2),
+                "p50": int(p50[i]),
+                "p90": int(p90[i]),
+                "vehicle_seconds": round(float(self.area[i]), 1)
+            }
+            for i, name in enumerate(names)
+        }
+
+
+class DensityAggregator:
+    def __init__(self, region_names, resolutions=resolutions, bins=histogram_bins):
+        self.names = list(region_names) + ["total"]
+        self.resolutions = sorted(resolutions)
+        if any(resolution % self.resolutions[0] for resolution in self.resolutions):
+            raise ValueError("Every resolution must be a multiple of the finest one")
+
+        self.windows = [Window(len(self.names), bins) for _ in self.resolutions]
+        self.counts = None
+        self.last = None
+
+    def observe(self, counts, now):
+        # `counts` (regions then total) holds from now until the next call.
+        # Returns [(resolution, window start, summary)] for windows that closed.
+        closed = []
+        finest = self.resolutions[0]
+        if self.last is not None:
+            moment = self.last
+            while moment < now:
+                boundary = (moment // finest + 1) * finest
+                end = min(boundary, now)
+                self.windows[0].add(self.counts, end - moment)
+                moment = end
+                if end == boundary:
+                    closed += self.close(boundary)
+
+        self.counts = numpy.asarray(counts, dtype=numpy.intp)
+        self.last = now
+        return closed
+
+    def close(self, boundary):
+        closed = []
+        for window in self.windows[1:]:
+            window.merge(self.windows[0])
+
+        for resolution, window in zip(self.resolutions, self.windows):
+            if boundary % resolution:
+                continue
+            if window.covered:
+                closed.append((resolution, boundary - resolution, window.summary(self.names)))
+            window.reset()
+        return closed
+
+
+def rollup_document(resolution, start, summary):
+    return {
+        "time": datetime.datetime.fromtimestamp(start, datetime.timezone.utc),
+        "resolution": resolution,
+        "location": GeoPoint(traffic.lat, traffic.lng),
+        "density": summary["total"]["mean"],
+        "total": summary["total"],
+        "regions": {name: stats for name, stats in summary.items() if name != "total"}
+    }
+
+
+def run(shared_data: StateStore, registry=None):
+    registry = registry or IntersectionRegistry()
+    region_names = registry.get().region_names
+    aggregator = DensityAggregator(region_names)
+    finest = aggregator.resolutions[0]
+    version = 0
+
+    while True:
+        # Wakes at each window boundary too, so quiet periods still roll up
+        version, data = shared_data.wait(version, timeout=finest - time.time() % finest)
+        if registry.get().region_names != region_names:
+            # Open windows are dropped, their regions no longer match
+            region_names = registry.get().region_names
+            aggregator = DensityAggregator(region_names)
+        counts = [data["vehicle"].get(name, 0) for name in region_names] + [data["total"]]
+
+        for resolution, start, summary in aggregator.observe(counts, time.time()):
+            document_id = f"{resolution}s_" + datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y%m%d_%H%M%S")
+            database.write_data("traffic_data", document_id, rollup_document(resolution, start, summary))
+            if resolution == aggregator.resolutions[-1]:
+                log.info("Auto-Logged Traffic Density Rollup")
@@ -0,0 +1,149 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: detection_log.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Compact on-disk log of every frame's detections, so the control and
+    accident logic can be re-run offline (replay.py) without the model.
+
+    A log is a folder of append-only columns, one raw little-endian file
+    each:
+        time.bin    float64  per frame, wall-clock time of the inference
+        end.bin     uint64   per frame, detections written up to and
+                             including this frame
+        box.bin     int16x4  per detection, x1 y1 x2 y2 in pixels
+        class.bin   uint8    per detection
+        conf.bin    float16  per detection
+    plus meta.json (class names, frame shape) and intersections.jsonl, the
+    intersection config in force from each frame on. A detection costs 11
+    bytes and a frame 16. The columns are flushed every flush_interval
+    seconds, so a crash loses up to that much of the log; detections are
+    flushed before the frame rows, and the reader drops any frame whose
+    detections did not all reach the disk.
+
+    DetectionLog memory-maps the columns, so opening a log of any length
+    reads nothing up front and whole ranges of frames can be processed as
+    array slices. frame() returns float32 Detections like a detector does.
+================================================================================
+"""
+
+
+import os
+import json
+import time
+
+import numpy
+
+from detector import Detections
+
+
+COLUMNS = {
+    "time": (numpy.dtype("<f8"), ()),
+    "end": (numpy.dtype("<u8"), ()),
+    "box": (numpy.dtype("<i2"), (4,)),
+    "class": (numpy.dtype("u1"), ()),
+    "conf": (numpy.dtype("<f2"), ())
+}
+flush_interval = 5.0
+
+
+def column_path(folder, column):
+    return os.path.join(folder, f"{column}.bin")
+
+
+class DetectionLogWriter:
+    def __init__(self, folder, names, frame_shape):
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, "meta.json"), "w") as file:
+            json.dump({"names": {str(k): v for k, v in names.items()}, "frame_shape": list(frame_shape), "created": time.time()}, file)
+
+        self.folder = folder
+        self.files = {column: open(column_path(folder, column), "ab") for column in COLUMNS}
+        self.frames = self.files["time"].tell() // COLUMNS["time"][0].itemsize
+        self.rows = self.files["conf"].tell() // COLUMNS["conf"][0].itemsize
+        self.last_flush = time.monotonic()
+
+    def set_config(self, config):
+        # Called with the intersection config whenever it changes
+        with open(os.path.join(self.folder, "intersections.jsonl"), "a") as file:
+            file.write(json.dumps({"frame": self.frames, "config": config}) + "\n")
+
+    def append(self, timestamp, detections):
+        boxes, classes, confs = detections
+        boxes = numpy.clip(boxes, -32768, 32767).astype("<i2")
+        self.files["box"].write(boxes.tobytes())
+        self.files["class"].write(classes.astype("u1").tobytes())
+        self.files["conf"].write(confs.astype("<f2").tobytes())
+
+        self.rows += len(boxes)
+        self.frames += 1
+        self.files["time"].write(numpy.float64(timestamp).astype("<f8").tobytes())
+        self.files["end"].write(numpy.uint64(self.rows).astype("<u8").tobytes())
+
+        now = time.monotonic()
+        if now - self.last_flush >= flush_interval:
+            self.flush()
+            self.last_flush = now
+
+    def flush(self):
+        # Detection columns first, so a frame row never points past them
+        for column in ("box", "class", "conf", "time", "end"):
+            self.files[column].flush()
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+
+class DetectionLog:
+    def __init__(self, folder):
+        with open(os.path.join(folder, "meta.json")) as file:
+            meta = json.load(file)
+        self.names = {int(k): v for k, v in meta["names"].items()}
+        self.frame_shape = tuple(meta["frame_shape"])
+
+        columns = {column: self.column(folder, column) for column in COLUMNS}
+        rows = min(len(columns["box"]), len(columns["class"]), len(columns["conf"]))
+        frames = min(len(columns["time"]), len(columns["end"]))
+
+        # Frames whose detections did not all make it to disk are dropped
+        frames = int(numpy.searchsorted(columns["end"][:frames], rows, side="right"))
+        self.times = columns["time"][:frames]
+        self.ends = columns["end"][:frames].astype(numpy.intp)
+        self.starts = numpy.concatenate(([0], self.ends[:-1])).astype(numpy.intp)
+        self.boxes = columns["box"]
+        self.classes = columns["class"]
+        self.confs = columns["conf"]
+
+        self.configs = []
+        path = os.path.join(folder, "intersections.jsonl")
+        if os.path.exists(path):
+            with open(path) as file:
+                self.configs = [json.loads(line) for line in file if line.strip()]
+
+    @staticmethod
+    def column(folder, column):
+        dtype, shape = COLUMNS[column]
+        path = column_path(folder, column)
+        count = os.path.getsize(path) // (dtype.itemsize * int(numpy.prod(shape))) if os.path.exists(path) else 0
+        if count == 0:
+            return numpy.empty((0, *shape), dtype)
+        return numpy.memmap(path, dtype, "r", shape=(count, *shape))
+
+    def __len__(self):
+        return len(self.times)
+
+    def frame(self, i):
+        start, end = self.starts[i], self.ends[i]
+        return float(self.times[i]), Detections(
+            self.boxes[start:end].astype(numpy.float32),
+            self.classes[start:end].astype(numpy.float32),
+            self.confs[start:end].astype(numpy.float32)
+        )
+
+    def config_changes(self):
+        # [(first frame, config)]
+        return [(entry["frame"], entry["config"]) for entry in self.configs]
@@ -0,0 +1,315 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: detector.py
+Author(s):
+    - Aashrith Srinivasa.
+    - Punya S (Training YOLO on custom dataset).
+    - Atrey K Urs (Training YOLO on custom dataset).
+License: See LICENSE file in the repository for full terms.
+Description:
+    Object detectors for the intersection pipeline. Every detector is a
+    callable taking a BGR frame and returning Detections (xyxy boxes,
+    class ids and confidences as numpy arrays), and exposes the class
+    names it was trained on, so post-processing and rendering never
+    depend on which model produced the boxes.
+
+    Backends: "ultralytics" runs the .pt model in PyTorch, "onnx" runs an
+    exported model in ONNX Runtime and "openvino" in OpenVINO. The last two
+    share letterboxing, YOLOv8 output decoding and NMS here, and accept the
+    FP32 or INT8 models produced by export_model.py.
+
+    RoiDetector wraps any backend to run it only on crops around the
+    configured regions, so fewer pixels go through the model per frame.
+================================================================================
+"""
+
+
+import os
+import ast
+from collections import namedtuple
+
+import cv2
+import numpy
+
+
+Detections = namedtuple("Detections", ["boxes", "classes", "confs"])
+
+CLASS_COLORS = {
+    "accident": (0, 0, 255),
+    "objects": (255, 128, 0)
+}
+
+
+def empty_detections():
+    return Detections(
+        numpy.zeros((0, 4), dtype=numpy.float32),
+        numpy.zeros(0, dtype=numpy.float32),
+        numpy.zeros(0, dtype=numpy.float32)
+    )
+
+
+def letterbox(frame, size):
+    # Resize keeping aspect ratio and pad to a size x size square, the way
+    # the model was trained. Returns the image, scale and (left, top) pad.
+    height, width = frame.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = round(width * scale), round(height * scale)
+    left, top = (size - new_w) // 2, (size - new_h) // 2
+
+    canvas = numpy.full((size, size, 3), 114, dtype=numpy.uint8)
+    canvas[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (left, top)
+
+
+def to_tensor(image):
+    # BGR uint8 HWC -> RGB float32 NCHW in [0, 1]
+    return cv2.dnn.blobFromImage(image, scalefactor=1 / 255, swapRB=True)
+
+
+def decode_output(output, scale, pad, frame_shape, conf_threshold, iou_threshold):
+    # YOLOv8 head: (1, 4 + classes, anchors) of cx, cy, w, h and class scores
+    predictions = output[0].T
+    scores = predictions[:, 4:]
+    classes = scores.argmax(axis=1)
+    confs = scores[numpy.arange(len(scores)), classes]
+
+    keep = confs >= conf_threshold
+    predictions, classes, confs = predictions[keep], classes[keep], confs[keep]
+    if not len(confs):
+        return empty_detections()
+
+    xywh = predictions[:, :4].copy()
+    xywh[:, 0] -= xywh[:, 2] / 2
+    xywh[:, 1] -= xywh[:, 3] / 2
+    chosen = cv2.dnn.NMSBoxesBatched(xywh.tolist(), confs.tolist(), classes.tolist(), conf_threshold, iou_threshold)
+    chosen = numpy.asarray(chosen, dtype=numpy.intp).reshape(-1)
+
+    boxes = xywh[chosen]
+    boxes[:, 2:] += boxes[:, :2]
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= scale
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, frame_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, frame_shape[0])
+
+    return Detections(
+        boxes.astype(numpy.float32),
+        classes[chosen].astype(numpy.float32),
+        confs[chosen].astype(numpy.float32)
+    )
+
+
+def load_names(path):
+    # Class names the ultralytics exporter saves in metadata.yaml next to the model
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    import yaml
+    with open(os.path.join(folder, "metadata.yaml")) as file:
+        return {int(key): value for key, value in yaml.safe_load(file)["names"].items()}
+
+
+class Detector:
+    # Shared pieces of every backend. Subclasses set `names` and `infer`.
+    input_size = 640
+    batch_capable = False
+    # Ultralytics' predict defaults, so every backend keeps the same boxes
+    conf_threshold = 0.25
+    iou_threshold = 0.7
+
+    def __call__(self, frame):
+        image, scale, pad = letterbox(frame, self.input_size)
+        output = self.infer(to_tensor(image))
+        return decode_output(output, scale, pad, frame.shape, self.conf_threshold, self.iou_threshold)
+
+    def detect_batch(self, frames):
+        # One model call for several frames when the model has a dynamic
+        # batch dimension, otherwise one call per frame
+        if not self.batch_capable or len(frames) == 1:
+            return [self(frame) for frame in frames]
+
+        prepared = [letterbox(frame, self.input_size) for frame in frames]
+        output = self.infer(numpy.concatenate([to_tensor(image) for image, _, _ in prepared]))
+        return [
+            decode_output(output[i:i + 1], scale, pad, frame.shape, self.conf_threshold, self.iou_threshold)
+            for i, (frame, (_, scale, pad)) in enumerate(zip(frames, prepared))
+        ]
+
+    def warmup(self, frame_shape, runs=2):
+        # The first inferences pay for allocation and kernel selection
+        frame = numpy.zeros(frame_shape, dtype=numpy.uint8)
+        for _ in range(runs):
+            self(frame)
+
+
+class YoloDetector(Detector):
+    def __init__(self, path, device="cpu", half=False, input_size=640, threads=0):
+        from ultralytics import YOLO
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+        self.model = YOLO(model=path, verbose=False)
+        self.names = self.model.names
+        self.device = device
+        self.half = half
+        self.input_size = input_size
+
+    def __call__(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        results = self.model.predict(
+            frames, verbose=False, device=self.device, half=self.half, imgsz=self.input_size,
+            conf=self.conf_threshold, iou=self.iou_threshold
+        )
+        return [
+            Detections(
+                result.boxes.xyxy.cpu().numpy(),
+                result.boxes.cls.cpu().numpy(),
+                result.boxes.conf.cpu().numpy()
+            )
+            for result in results
+        ]
+
+
+class OnnxDetector(Detector):
+    def __init__(self, path, input_size=640, threads=0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.batch_capable = not isinstance(self.session.get_inputs()[0].shape[0], int)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else load_names(path)
+        self.input_size = input_size
+
+    def infer(self, tensor):
+        return self.session.run(None, {self.input_name: tensor})[0]
+
+
+class OpenVinoDetector(Detector):
+    def __init__(self, path, input_size=640, threads=0):
+        import openvino
+
+        if os.path.isdir(path):
+            path = next(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".xml"))
+
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+
+        self.model = openvino.Core().compile_model(path, "CPU", config)
+        self.batch_capable = self.model.inputs[0].get_partial_shape()[0].is_dynamic
+        self.names = load_names(path)
+        self.input_size = input_size
+
+    def infer(self, tensor):
+        return self.model(tensor)[0]
+
+
+def region_tiles(regions, frame_shape, margin=32, merge_ratio=1.3):
+    # Crops (x1, y1, x2, y2) covering every region. Region boxes are merged
+    # greedily while the merged box is not much bigger than the two parts,
+    # so nearby regions share one crop and distant ones get their own tile.
+    height, width = frame_shape[:2]
+    tiles = []
+    for points in regions.values():
+        xs, ys = zip(*points)
+        tiles.append((
+            max(min(xs) - margin, 0), max(min(ys) - margin, 0),
+            min(max(xs) + margin, width), min(max(ys) + margin, height)
+        ))
+
+    def area(box):
+        return (box[2] - box[0]) * (box[3] - box[1])
+
+    merged = True
+    while merged and len(tiles) > 1:
+        merged = False
+        for i in range(len(tiles)):
+            for j in range(i + 1, len(tiles)):
+                a, b = tiles[i], tiles[j]
+                union = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                if area(union) <= merge_ratio * (area(a) + area(b)):
+                    tiles[i] = union
+                    del tiles[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return tiles
+
+
+class RoiDetector:
+    # Runs the wrapped detector only on the crops covering the configured
+    # regions and maps the boxes back to frame coordinates. Anything outside
+    # the crops (regions plus `margin`) is not seen by the model.
+    def __init__(self, detector, regions, frame_shape, margin=32, merge_ratio=1.3):
+        self.detector = detector
+        self.names = detector.names
+        self.tiles = region_tiles(regions, frame_shape, margin, merge_ratio)
+
+    def __call__(self, frame):
+        parts = []
+        for x1, y1, x2, y2 in self.tiles:
+            detections = self.detector(frame[y1:y2, x1:x2])
+            boxes = detections.boxes.copy()
+            boxes[:, [0, 2]] += x1
+            boxes[:, [1, 3]] += y1
+            parts.append(Detections(boxes, detections.classes, detections.confs))
+
+        if len(parts) == 1:
+            return parts[0]
+
+        boxes, classes, confs = (numpy.concatenate(column) for column in zip(*parts))
+        if not len(confs):
+            return empty_detections()
+
+        # Tiles overlap by the margin, so an object on a seam can be found twice
+        xywh = boxes.copy()
+        xywh[:, 2:] -= xywh[:, :2]
+        chosen = cv2.dnn.NMSBoxesBatched(xywh.tolist(), confs.tolist(), classes.astype(int).tolist(), 0.0, Detector.iou_threshold)
+        chosen = numpy.asarray(chosen, dtype=numpy.intp).reshape(-1)
+        return Detections(boxes[chosen], classes[chosen], confs[chosen])
+
+    def detect_batch(self, frames):
+        return [self(frame) for frame in frames]
+
+    def warmup(self, frame_shape, runs=2):
+        frame = numpy.zeros(frame_shape, dtype=numpy.uint8)
+        for _ in range(runs):
+            self(frame)
+
+
+BACKENDS = {
+    "ultralytics": lambda path, input_size, threads: YoloDetector(path, "cpu", False, input_size, threads),
+    "onnx": OnnxDetector,
+    "openvino": OpenVinoDetector
+}
+
+
+def create_detector(backend, path, input_size=640, threads=0):
+    return BACKENDS[backend](path, input_size, threads)
+
+
+def draw_detections(frame, detections, names):
+    annotated = frame.copy()
+
+    for box, classid, conf in zip(detections.boxes.astype(int), detections.classes, detections.confs):
+        x1, y1, x2, y2 = box
+        label = names.get(int(classid), str(int(classid)))
+        color = CLASS_COLORS.get(label, (0, 255, 255))
+
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(
+            annotated, f"{label} {conf:.2f}", (x1, max(y1 - 5, 10)),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1
+        )
+
+    return annotated
@@ -0,0 +1,133 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: export_model.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Exports custom_yolo.pt for the CPU inference backends in detector.py.
+    Produces an ONNX model for ONNX Runtime or an OpenVINO IR, and can
+    quantize either to INT8, calibrated on a directory of frames captured
+    at the intersection so the activation ranges match real traffic.
+
+    Usage:
+        python export_model.py --format onnx --imgsz 640
+        python export_model.py --format onnx --int8 --calib ../calibration_frames
+        python export_model.py --format openvino --int8 --calib ../calibration_frames
+================================================================================
+"""
+
+
+import os
+import shutil
+import argparse
+import logging as log
+
+import cv2
+import yaml
+
+from detector import letterbox, to_tensor
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def calibration_tensors(folder, input_size, limit):
+    # Preprocessed exactly like detector.Detector does at runtime
+    files = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    for name in files[:limit]:
+        frame = cv2.imread(os.path.join(folder, name))
+        if frame is not None:
+            yield to_tensor(letterbox(frame, input_size)[0])
+
+
+def export_onnx(weights, input_size, dynamic=False):
+    from ultralytics import YOLO
+
+    model = YOLO(model=weights, verbose=False)
+    path = model.export(format="onnx", imgsz=input_size, simplify=True, dynamic=dynamic)
+
+    # Keep the class names beside the model as well as inside it
+    with open(os.path.join(os.path.dirname(path), "metadata.yaml"), "w") as file:
+        yaml.safe_dump({"names": dict(model.names)}, file)
+
+    return path
+
+
+def quantize_onnx(path, calib, input_size, limit):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.input_name = onnx.load(path).graph.input[0].name
+            self.tensors = calibration_tensors(calib, input_size, limit)
+
+        def get_next(self):
+            tensor = next(self.tensors, None)
+            return None if tensor is None else {self.input_name: tensor}
+
+    output = path.replace(".onnx", "_int8.onnx")
+    quantize_static(
+        path, output, FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+
+    # quantize_static does not carry the exporter's metadata across
+    source, quantized = onnx.load(path), onnx.load(output)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, output)
+
+    return output
+
+
+def export_openvino(onnx_path, calib, input_size, limit, int8):
+    import openvino
+
+    model = openvino.Core().read_model(onnx_path)
+    folder = onnx_path.replace(".onnx", "_int8_openvino_model" if int8 else "_openvino_model")
+    os.makedirs(folder, exist_ok=True)
+
+    if int8:
+        import nncf
+
+        dataset = nncf.Dataset(list(calibration_tensors(calib, input_size, limit)))
+        model = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED)
+
+    output = os.path.join(folder, os.path.basename(onnx_path).replace(".onnx", ".xml"))
+    openvino.save_model(model, output)
+    shutil.copy(os.path.join(os.path.dirname(onnx_path), "metadata.yaml"), folder)
+
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the TraffIQ YOLO model for CPU backends")
+    parser.add_argument("--weights", default="../custom_yolo.pt")
+    parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--imgsz", type=int, default=640, help="model input size")
+    parser.add_argument("--dynamic", action="store_true", help="dynamic batch size, for batched inference in supervisor.py")
+    parser.add_argument("--int8", action="store_true", help="quantize to INT8")
+    parser.add_argument("--calib", help="directory of calibration frames (required with --int8)")
+    parser.add_argument("--calib-frames", type=int, default=300, help="frames used for calibration")
+    args = parser.parse_args()
+
+    log.basicConfig(level=log.INFO, format="%(asctime)s // %(levelname)s [%(filename)s] :: %(message)s")
+
+    if args.int8 and not args.calib:
+        parser.error("--int8 needs --calib")
+
+    onnx_path = export_onnx(args.weights, args.imgsz, args.dynamic)
+    log.info(f"Exported {onnx_path}")
+
+    if args.format == "onnx" and args.int8:
+        output = quantize_onnx(onnx_path, args.calib, args.imgsz, args.calib_frames)
+        log.info(f"Quantized to {output}")
+
+    elif args.format == "openvino":
+        output = export_openvino(onnx_path, args.calib, args.imgsz, args.calib_frames, args.int8)
+        log.info(f"Exported {output}")
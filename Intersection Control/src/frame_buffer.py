@@ -0,0 +1,96 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: frame_buffer.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Preallocated multi-slot frame buffer in shared memory, so capture,
+    inference, encoding and clip recording can run in separate processes
+    and use the same frames without copying them.
+
+    One writer fills slots round-robin. Every slot has a sequence word in
+    the header (seqlock): it is odd while the slot is being written and
+    2 * seq once frame `seq` is complete. Readers take a view of a slot,
+    copy or use it, then call valid(seq) to check the writer has not lapped
+    them; with N slots a reader has N - 1 frame periods before that happens,
+    so slow consumers copy first and check before working on the copy.
+================================================================================
+"""
+
+
+import numpy
+from multiprocessing.shared_memory import SharedMemory
+
+
+HEADER_WORDS = 1
+
+
+class SharedFrameBuffer:
+    def __init__(self, shape, slots=8, name=None):
+        # name None creates the segment, otherwise attaches to it
+        self.shape = tuple(shape)
+        self.slots = slots
+        header_bytes = (HEADER_WORDS + slots) * 8
+        frame_bytes = int(numpy.prod(self.shape))
+
+        if name is None:
+            self.memory = SharedMemory(create=True, size=header_bytes + frame_bytes * slots)
+            self.owner = True
+        else:
+            try:
+                self.memory = SharedMemory(name=name, track=False)
+            except TypeError:
+                self.memory = SharedMemory(name=name)
+            self.owner = False
+
+        self.name = self.memory.name
+        self.header = numpy.ndarray(HEADER_WORDS + slots, dtype=numpy.int64, buffer=self.memory.buf)
+        self.frames = numpy.ndarray((slots, *self.shape), dtype=numpy.uint8, buffer=self.memory.buf, offset=header_bytes)
+        if self.owner:
+            self.header[:] = 0
+
+    # Writer side
+
+    def begin_write(self):
+        # Returns (seq, view) of the next slot. Fill the view, then end_write.
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        self.header[HEADER_WORDS + slot] = 2 * seq - 1
+        return seq, self.frames[slot]
+
+    def end_write(self, seq):
+        self.header[HEADER_WORDS + seq % self.slots] = 2 * seq
+        self.header[0] = seq
+
+    # Reader side
+
+    def latest(self):
+        return int(self.header[0])
+
+    def valid(self, seq):
+        return seq > 0 and self.header[HEADER_WORDS + seq % self.slots] == 2 * seq
+
+    def locate(self, array):
+        # (slot, y, x) of an array that is a view into one of the slots, so
+        # another process can find the same pixels without a copy. The
+        # slot's current header is not trusted for which frame it is: the
+        # writer may have reused it since; callers check their own seq.
+        interface = self.frames.__array_interface__
+        offset = array.__array_interface__["data"][0] - interface["data"][0]
+        if array.strides[1:] != self.frames.strides[2:] or not 0 <= offset < self.frames.nbytes:
+            return None
+
+        slot, remainder = divmod(offset, self.frames.strides[0])
+        y, remainder = divmod(remainder, self.frames.strides[1])
+        x = remainder // self.frames.strides[2]
+        return slot, y, x
+
+    def view(self, seq, y, x, height, width):
+        return self.frames[seq % self.slots, y:y + height, x:x + width]
+
+    def close(self):
+        del self.header, self.frames
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,196 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: hospital.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Nearest hospital lookup for accident records. Hospitals are loaded from
+    a local CSV (columns name, lat, lng, plus any extra columns such as
+    phone or address, which are passed through) into a grid of lat / lng
+    cells. A k-nearest query scans rings of cells outwards from the query's
+    cell and stops once no unscanned cell can be closer than the k-th
+    hospital found, ranking the candidates by haversine distance.
+
+    An optional road graph (JSON: {"nodes": {id: [lat, lng]}, "edges":
+    [[id, id, meters], ...]}, edges both ways) refines the straight-line
+    candidates by driving distance. Lookups are meant to be done once per
+    intersection, not per accident; see accident.run.
+================================================================================
+"""
+
+
+import csv
+import json
+import math
+import heapq
+import logging as log
+
+import numpy
+
+
+hospitals_file = "../hospitals.csv"
+road_graph_file = None
+nearest_count = 3
+road_candidates = 10
+cell_degrees = 0.05
+
+EARTH_RADIUS = 6371008.8
+
+
+def haversine(lat, lng, lats, lngs):
+    # Meters from one point to each of `lats` / `lngs`
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats, lngs = numpy.radians(lats), numpy.radians(lngs)
+    a = numpy.sin((lats - lat) / 2) ** 2 + math.cos(lat) * numpy.cos(lats) * numpy.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+
+def load_hospitals(path):
+    with open(path, newline="") as file:
+        hospitals = []
+        for row in csv.DictReader(file):
+            row["lat"], row["lng"] = float(row["lat"]), float(row["lng"])
+            hospitals.append(row)
+    return hospitals
+
+
+class HospitalIndex:
+    def __init__(self, hospitals, cell=cell_degrees):
+        self.hospitals = hospitals
+        self.cell = cell
+        self.lats = numpy.array([hospital["lat"] for hospital in hospitals], dtype=float)
+        self.lngs = numpy.array([hospital["lng"] for hospital in hospitals], dtype=float)
+
+        self.grid = {}
+        rows = numpy.floor(self.lats / cell).astype(int)
+        cols = numpy.floor(self.lngs / cell).astype(int)
+        for i, key in enumerate(zip(rows.tolist(), cols.tolist())):
+            self.grid.setdefault(key, []).append(i)
+        self.grid = {key: numpy.array(members) for key, members in self.grid.items()}
+        self.extent = (rows.min(), rows.max(), cols.min(), cols.max()) if hospitals else None
+
+    def ring(self, row, col, r):
+        if r == 0:
+            return [(row, col)]
+        top = [(row - r, col + dc) for dc in range(-r, r + 1)]
+        bottom = [(row + r, col + dc) for dc in range(-r, r + 1)]
+        sides = [(row + dr, col + side) for dr in range(-r + 1, r) for side in (-r, r)]
+        return top + bottom + sides
+
+    def nearest(self, lat, lng, k=nearest_count):
+        # Returns [(distance in meters, hospital)], closest first
+        if not self.hospitals:
+            return []
+
+        k = min(k, len(self.hospitals))
+        row, col = math.floor(lat / self.cell), math.floor(lng / self.cell)
+        low_row, high_row, low_col, high_col = self.extent
+        last_ring = max(row - low_row, high_row - row, col - low_col, high_col - col)
+        found = []
+
+        for r in range(last_ring + 1):
+            members = [self.grid[key] for key in self.ring(row, col, r) if key in self.grid]
+            if members:
+                found.append(numpy.concatenate(members))
+            if sum(len(ids) for ids in found) < k:
+                continue
+
+            # Cells past ring r are at least r cells away in latitude or in
+            # longitude, and a degree of longitude is shortest at the far edge
+            ids = numpy.concatenate(found)
+            distances = haversine(lat, lng, self.lats[ids], self.lngs[ids])
+            far_lat = min(abs(lat) + (r + 1) * self.cell, 90.0)
+            reach = r * self.cell * math.radians(1) * EARTH_RADIUS * math.cos(math.radians(far_lat))
+            if numpy.partition(distances, k - 1)[k - 1] <= reach:
+                break
+
+        ids = numpy.concatenate(found)
+        distances = haversine(lat, lng, self.lats[ids], self.lngs[ids])
+        order = numpy.argsort(distances)[:k]
+        return [(float(distances[i]), self.hospitals[ids[i]]) for i in order]
+
+
+class RoadGraph:
+    def __init__(self, nodes, edges):
+        self.ids = list(nodes)
+        self.lats = numpy.array([nodes[node][0] for node in self.ids], dtype=float)
+        self.lngs = numpy.array([nodes[node][1] for node in self.ids], dtype=float)
+        self.adjacent = {node: [] for node in self.ids}
+        for a, b, meters in edges:
+            self.adjacent[a].append((b, meters))
+            self.adjacent[b].append((a, meters))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            graph = json.load(file)
+        return cls(graph["nodes"], graph["edges"])
+
+    def snap(self, lat, lng):
+        # Nearest node and the straight-line meters to it
+        distances = haversine(lat, lng, self.lats, self.lngs)
+        i = int(distances.argmin())
+        return self.ids[i], float(distances[i])
+
+    def distances(self, source):
+        # Dijkstra from `source` to every reachable node
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            meters, node = heapq.heappop(heap)
+            if meters > best[node]:
+                continue
+            for neighbour, length in self.adjacent[node]:
+                total = meters + length
+                if total < best.get(neighbour, math.inf):
+                    best[neighbour] = total
+                    heapq.heappush(heap, (total, neighbour))
+        return best
+
+    def refine(self, lat, lng, candidates, k=nearest_count):
+        # Re-ranks [(distance, hospital)] by road distance; hospitals the
+        # graph cannot reach keep their place after the reachable ones
+        source, offset = self.snap(lat, lng)
+        reachable = self.distances(source)
+        ranked = []
+        for distance, hospital in candidates:
+            node, last_leg = self.snap(hospital["lat"], hospital["lng"])
+            road = reachable.get(node)
+            road = None if road is None else offset + road + last_leg
+            ranked.append((road is None, road or 0.0, distance, hospital, road))
+
+        ranked.sort(key=lambda entry: entry[:3])
+        return [(distance, hospital, road) for _, _, distance, hospital, road in ranked[:k]]
+
+
+def nearest_hospitals(lat, lng, k=nearest_count):
+    # Returns [{"name", "lat", "lng", ..., "distance_m", "road_distance_m"}],
+    # or [] when there is no hospital dataset
+    try:
+        index = HospitalIndex(load_hospitals(hospitals_file))
+
+    except (OSError, KeyError, ValueError) as e:
+        log.warning(f"Hospital Data Unavailable: {e}")
+        return []
+
+    graph = None
+    if road_graph_file is not None:
+        try:
+            graph = RoadGraph.load(road_graph_file)
+
+        except (OSError, KeyError, ValueError) as e:
+            log.warning(f"Road Graph Unavailable, Using Straight-Line Distance: {e}")
+
+    if graph is None:
+        ranked = [(distance, hospital, None) for distance, hospital in index.nearest(lat, lng, k)]
+    else:
+        ranked = graph.refine(lat, lng, index.nearest(lat, lng, max(k, road_candidates)), k)
+
+    nearest = []
+    for distance, hospital, road in ranked:
+        entry = {**hospital, "distance_m": round(distance)}
+        if road is not None:
+            entry["road_distance_m"] = round(road)
+        nearest.append(entry)
+    return nearest
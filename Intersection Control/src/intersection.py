@@ -0,0 +1,226 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: intersection.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Intersection configuration registry. The geometry of the regions, the
+    Arduino signal unit of each region, the phase order and the controller
+    timing bounds are loaded once from a JSON file, a Firestore document or
+    the built-in database.get_intersection_data(). Everything derived from
+    them (label mask, overlay image and its bounds, ROI tiles) is built
+    once per version in an immutable Intersection.
+
+    When the file or document changes, the new config is validated and
+    precomputed on the watcher thread and then swapped in as one reference.
+    Readers call registry.get() and rebuild their own state only when the
+    version changes, so the capture loop never stops or waits for it.
+
+    Config:
+        {
+            "regions": {"A": [[0, 205], [0, 375], [250, 375], [250, 205]]},
+            "signals": {"A": "A"},
+            "phase_order": ["A", "B", "C"],
+            "timing": {"yellow": 2, "pressure": {"min_green": 5, "max_green": 40}}
+        }
+    Points may also be flat [x1, y1, x2, y2, ...] lists or {"x", "y"} maps,
+    since Firestore cannot store nested arrays. Only "regions" is required.
+    Signal units are the letters the Arduino sketch drives (`signal_units`),
+    and a config is only accepted if every controller can be built from its
+    phase order and timing, which requires positive greens, yellow and
+    extension and a max_green no shorter than min_green.
+    A Firestore source is written "firestore:<collection>/<document>".
+================================================================================
+"""
+
+
+import os
+import json
+import time
+import threading
+import logging as log
+
+import cv2
+import numpy
+
+import database
+import metrics
+from detector import region_tiles
+from controller import CONTROLLERS, create_controller, positive
+
+
+signal_units = "ABC"
+
+config_reloads = metrics.Counter("traffiq_intersection_reloads_total", "Intersection configs swapped in after a change")
+config_rejected = metrics.Counter("traffiq_intersection_rejected_total", "Changed intersection configs that failed validation")
+
+
+def create_region_mask(frame_shape, regions):
+    # Label image: 0 is outside every region, i + 1 is the i-th region.
+    # Filled in reverse so the first listed region wins where they overlap.
+    mask = numpy.zeros(frame_shape[:2], dtype=numpy.uint8)
+
+    for label, points in reversed(list(enumerate(regions.values(), start=1))):
+        pts = numpy.array(points, numpy.int32).reshape((-1, 1, 2))
+        cv2.fillPoly(mask, [pts], label)
+
+    return mask
+
+
+def create_region_overlay(frame_shape, regions):
+    overlay = numpy.zeros((*frame_shape[:2], 3), dtype=numpy.uint8)
+
+    for name, points in regions.items():
+        pts = numpy.array(points, numpy.int32).reshape((-1, 1, 2))
+
+        # Transparent fill (light green)
+        cv2.fillPoly(overlay, [pts], (0, 255, 0))
+
+        # Outline
+        cv2.polylines(overlay, [pts], isClosed=True, color=(0, 0, 0), thickness=2)
+
+        # Label
+        x, y = points[0]
+        cv2.putText(
+            overlay, name, (x, y - 5),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2
+        )
+
+    return overlay
+
+
+def overlay_bounds(overlay):
+    # Bounding box (x, y, w, h) of everything drawn on the overlay
+    points = cv2.findNonZero(cv2.cvtColor(overlay, cv2.COLOR_BGR2GRAY))
+    if points is None:
+        return 0, 0, 0, 0
+    return cv2.boundingRect(points)
+
+
+def parse_points(points):
+    if points and isinstance(points[0], dict):
+        points = [(point["x"], point["y"]) for point in points]
+    elif points and not isinstance(points[0], (list, tuple)):
+        points = list(zip(points[0::2], points[1::2]))
+
+    points = [(int(x), int(y)) for x, y in points]
+    if len(points) < 3:
+        raise ValueError("A region needs at least three points")
+    return points
+
+
+class Intersection:
+    # Immutable once built; a changed config produces a new instance
+    def __init__(self, config, frame_shape, version=1):
+        self.config = config
+        self.version = version
+        self.regions = {str(name): parse_points(points) for name, points in config["regions"].items()}
+        if not self.regions:
+            raise ValueError("No regions configured")
+
+        self.region_names = list(self.regions.keys())
+        self.signals = {name: str(config.get("signals", {}).get(name, name)) for name in self.region_names}
+        for name, unit in self.signals.items():
+            if len(unit) != 1 or unit not in signal_units:
+                raise ValueError(f"Region {name} has signal unit {unit!r}, expected one of {signal_units}")
+
+        self.phase_order = list(config.get("phase_order") or self.region_names)
+        if set(self.phase_order) - set(self.region_names):
+            raise ValueError("phase_order names a region that does not exist")
+
+        self.timing = config.get("timing", {})
+        self.yellow_time = positive("yellow", self.timing.get("yellow", 2))
+
+        # Unknown timing sections are typos; known ones must build
+        unknown = set(self.timing) - set(CONTROLLERS) - {"yellow"}
+        if unknown:
+            raise ValueError(f"Unknown timing sections: {sorted(unknown)}")
+        for name in CONTROLLERS:
+            create_controller(name, self.phase_order, self.timing)
+
+        self.mask = create_region_mask(frame_shape, self.regions)
+        self.overlay = create_region_overlay(frame_shape, self.regions)
+        self.overlay_bounds = overlay_bounds(self.overlay)
+        self.tiles = region_tiles(self.regions, frame_shape)
+        self.mask.setflags(write=False)
+        self.overlay.setflags(write=False)
+
+
+class IntersectionRegistry:
+    def __init__(self, source=None, frame_shape=(720, 1280, 3), config=None, poll_interval=2.0):
+        # `config` pins a fixed config (e.g. from cameras.json) instead of a source
+        self.source = None if config is not None else source
+        self.frame_shape = frame_shape
+        self.poll_interval = poll_interval
+        self.current = Intersection(config if config is not None else self.load(), frame_shape)
+        self.watcher = None
+
+    def get(self):
+        return self.current
+
+    def load(self):
+        if self.source is None:
+            return {"regions": database.get_intersection_data()}
+
+        if self.source.startswith("firestore:"):
+            return database.database.document(self.source[len("firestore:"):]).get().to_dict()
+
+        with open(self.source) as file:
+            return json.load(file)
+
+    def apply(self, config):
+        # Built completely before the swap, so readers never see half a config
+        if config == self.current.config:
+            return False
+
+        try:
+            intersection = Intersection(config, self.frame_shape, self.current.version + 1)
+
+        except Exception as e:
+            # Anything a malformed config can raise is a rejection, so a bad
+            # save never reaches the watcher that applied it
+            log.error(f"Rejected Intersection Config: {e!r}")
+            config_rejected.inc()
+            return False
+
+        self.current = intersection
+        config_reloads.inc()
+        log.info(f"Intersection Config v{intersection.version} Loaded ({len(intersection.regions)} Regions)")
+        return True
+
+    def watch(self):
+        if self.source is None:
+            return
+
+        if self.source.startswith("firestore:"):
+            def on_snapshot(documents, changes, read_time):
+                try:
+                    if documents and documents[0].exists:
+                        self.apply(documents[0].to_dict())
+
+                except Exception:
+                    log.exception("Could Not Reload Intersection Config")
+
+            self.watcher = database.database.document(self.source[len("firestore:"):]).on_snapshot(on_snapshot)
+
+        else:
+            self.watcher = threading.Thread(target=self.poll_file, daemon=True)
+            self.watcher.start()
+
+    def poll_file(self):
+        modified = os.stat(self.source).st_mtime
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                if os.stat(self.source).st_mtime == modified:
+                    continue
+                modified = os.stat(self.source).st_mtime
+                self.apply(self.load())
+
+            except (OSError, json.JSONDecodeError) as e:
+                log.error(f"Could Not Reload Intersection Config: {e}")
+
+            except Exception:
+                # The watcher must outlive any one bad save
+                log.exception("Could Not Reload Intersection Config")
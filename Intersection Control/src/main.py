@@ -16,27 +16,51 @@ Description:
 
 
 
+import os
+import time
+import argparse
 import threading
 import logging as log
 from sys import exit
 
 import cv2
 import numpy
-from ultralytics import YOLO
 
+import camera
 import traffic
 import accident
 import database
+import density
+import metrics
+import hospital
 import webserver
+from state import StateStore, initial_state
+from detector import BACKENDS, RoiDetector, create_detector, draw_detections, empty_detections
+from scheduler import MotionGate
+from controller import CONTROLLERS, DegradedController, create_controller
+from intersection import IntersectionRegistry
+from startup import Startup
+from recorder import ClipRecorder
+from tracker import Tracker, empty_flow
+from detection_log import DetectionLogWriter
 
 
 capture_source = 0
 frame_width = 1280
 frame_height = 720
-lock = threading.Lock()
-model = YOLO(model="../custom_yolo.pt", verbose=False)
-model_device = 'cpu'
-model_half = False
+model = None
+model_backend = "ultralytics"
+model_path = "../custom_yolo.pt"
+model_input_size = 640
+model_threads = 0
+headless = False
+motion_gating = False
+motion_min_rate = 1.0
+tracking = True
+clip_folder = "../accident_clips"
+intersection_config = None
+detection_log_folder = None
+degraded_start = True
 
 log.basicConfig(
     level=log.INFO,
@@ -44,157 +68,284 @@ log.basicConfig(
 )
 
 
-def capture_init():
-    capture = cv2.VideoCapture(capture_source)
+def open_camera():
+    capture = camera.open_capture(capture_source, frame_width, frame_height)
     if not capture.isOpened():
         log.critical("Unable to Open Capture Source")
         exit(1)
-    
-    capture.release()
 
+    return capture
 
-def get_region(cx, cy):
-    point = (float(cx), float(cy))   # force tuple of floats
-    for name, points in regions.items():
-        contour = numpy.array(points, dtype=numpy.int32)
-        if cv2.pointPolygonTest(contour, point, False) >= 0:
-            return name
-    return None
 
+def load_model(backend, path, input_size, threads):
+    detector = create_detector(backend, path, input_size, threads)
+    detector.warmup((frame_height, frame_width, 3))
+    log.info(f"Loaded {backend} model {path}")
+    return detector
 
-def create_region_overlay(frame_shape, regions):
-    overlay = numpy.zeros((*frame_shape[:2], 3), dtype=numpy.uint8)
 
-    for name, points in regions.items():
-        pts = numpy.array(points, numpy.int32).reshape((-1, 1, 2))
+def start_traffic(shared_data, registry, detector_ready):
+    # In degraded mode the signals cycle on a fixed-time plan until the
+    # detector is ready, instead of staying dark while the model loads
+    def make_controller(intersection):
+        controller = create_controller(traffic.controller_name, intersection.phase_order, intersection.timing)
+        if degraded_start:
+            fallback = create_controller("fixed_time", intersection.phase_order, intersection.timing)
+            controller = DegradedController(controller, fallback, detector_ready)
+        return controller
 
-        # Transparent fill (light green)
-        cv2.fillPoly(overlay, [pts], (0, 255, 0))
+    threading.Thread(target=traffic.run, args=(shared_data, registry, make_controller), daemon=True).start()
 
-        # Outline
-        cv2.polylines(overlay, [pts], isClosed=True, color=(0, 0, 0), thickness=2)
 
-        # Label
-        x, y = points[0]
-        cv2.putText(
-            overlay, name, (x, y - 5),
-            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2
-        )
+def count_detections(boxes, classes, confs, region_mask, region_names, class_ids):
+    classes = classes.astype(numpy.intp, copy=False)
 
-    return overlay
+    is_accident = classes == class_ids.get("accident", -1)
+    is_vehicle = classes == class_ids.get("objects", -1)
 
+    accident_count = int(numpy.count_nonzero(is_accident))
+    confidence = float(confs[is_accident][-1]) * 100 if accident_count else 0
 
-def blend_overlay(frame, overlay, alpha=0.5):
-    return cv2.addWeighted(frame, 1, overlay, alpha, 0)
+    vehicles = boxes[is_vehicle].astype(numpy.intp)
+    cx = (vehicles[:, 0] + vehicles[:, 2]) // 2
+    cy = (vehicles[:, 1] + vehicles[:, 3]) // 2
 
+    height, width = region_mask.shape
+    inside = (cx >= 0) & (cx < width) & (cy >= 0) & (cy < height)
+    labels = region_mask[cy[inside], cx[inside]]
+    counts = numpy.bincount(labels, minlength=len(region_names) + 1)[1:]
 
-def main():
-    log.info("Starting Threads...")
-    trf_thread = threading.Thread(target=traffic.run, args=(shared_data, lock), daemon=True)
-    acc_thread = threading.Thread(target=accident.run, args=(shared_data, lock), daemon=True)
-    wsk_thread = threading.Thread(target=webserver.run, args=("0.0.0.0", 8765), daemon=True)
-    trf_thread.start()
-    acc_thread.start()
-    wsk_thread.start()
-    log.info("Threads Started")
+    region_counts = dict(zip(region_names, counts.tolist()))
+    return region_counts, len(vehicles), accident_count, confidence
 
-    capture = cv2.VideoCapture(capture_source, cv2.CAP_DSHOW)
-    capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
-    capture.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width)
-    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height)
-    log.info("Capture Source Open")
 
-    names = model.names
-    dummy_frame = numpy.zeros((frame_height, frame_width, 3), dtype=numpy.uint8)
-    region_overlay = create_region_overlay(dummy_frame.shape, regions)
+def blend_overlay(frame, overlay, bounds, alpha=0.5):
+    # Blends in place, and only over the part of the frame the overlay covers
+    x, y, w, h = bounds
+    roi = frame[y:y + h, x:x + w]
+    cv2.addWeighted(roi, 1, overlay[y:y + h, x:x + w], alpha, 0, dst=roi)
+    return frame
 
 
-    try:
-        prev_data = None
+frames_processed = metrics.Counter("traffiq_frames_processed_total", "Frames that went through inference")
+inference_failures = metrics.Counter("traffiq_inference_failures_total", "Frames skipped because inference raised")
 
-        while capture.isOpened():
-            success, frame = capture.read()
-            if not success:
-                log.error("Failed to read frame")
-                break
 
+def record(timings, stage, start):
+    now = time.perf_counter()
+    metrics.stage(stage).observe(now - start)
+    if timings is not None:
+        timings.setdefault(stage, []).append(now - start)
+    return now
+
+
+def open_detection_log(folder, names, frame_shape):
+    # One log per run, named after its start time
+    return DetectionLogWriter(os.path.join(folder, time.strftime("%Y%m%d_%H%M%S")), names, frame_shape)
+
+
+def run_pipeline(frame_slot, detector, registry, shared_data, timings=None, recorder=None, detection_log=None):
+    # Inference loop: runs until the frame slot is closed or 'q' is pressed.
+    # `registry` is an IntersectionRegistry; a reloaded config is picked up
+    # between two frames. `timings`, when given, collects per-stage
+    # latencies in seconds. `recorder`, when given, gets every raw frame
+    # for accident clips. `detection_log`, a DetectionLogWriter, gets every
+    # frame's detections for replay.py.
+    class_ids = {name: classid for classid, name in detector.names.items()}
+    intersection = None
+    detections = empty_detections()
+
+    while True:
+        start = time.perf_counter()
+        seq, frame = frame_slot.get(timeout=1)
+        if frame is None:
+            if frame_slot.closed:
+                break
+            continue
+        start = record(timings, "wait", start)
+
+        reloaded = registry.get() is not intersection
+        if reloaded:
+            # Everything heavy was precomputed by the registry
+            intersection = registry.get()
+            region_names = intersection.region_names
+            region_mask = intersection.mask
+            motion_gate = MotionGate(region_mask, min_rate=motion_min_rate) if motion_gating else None
+            tracker = Tracker(region_mask, region_names, class_ids.get("objects", -1)) if tracking else None
+            flow = empty_flow(region_names)
+            if isinstance(detector, RoiDetector):
+                detector.tiles = intersection.tiles
+            if detection_log is not None:
+                detection_log.set_config(intersection.config)
+
+        if recorder is not None:
+            recorder.offer(frame)
+            start = record(timings, "preroll", start)
+
+        infer = True
+        if motion_gate is not None and not reloaded:
+            infer = motion_gate.should_infer(frame)
+            start = record(timings, "motion_gate", start)
+
+        if infer:
             try:
-                results = model.predict(frame, verbose=False, device=model_device, half=model_half)
+                detections = detector(frame)
 
             except Exception:
                 log.exception("Model Inference Failed, Skipping Frame")
+                inference_failures.inc()
                 continue
-
-            result = results[0]
-
-            confidence = 0
-            accident_count = 0
-            total_vehicle_count = 0
-            region_counts = dict.fromkeys(regions.keys(), 0)
-
-            for box, classid, conf in zip(result.boxes.xyxy.cpu().numpy(), result.boxes.cls.cpu().numpy(), result.boxes.conf.cpu().numpy()):
-                x1, y1, x2, y2 = box.astype(int)
-                label = names[int(classid)]
-
-                if label == "accident":
-                    confidence = float(conf) * 100
-                    accident_count += 1
-
-                elif label == "objects":
-                    total_vehicle_count += 1
-                    cx = (x1 + x2) // 2
-                    cy = (y1 + y2) // 2
-                    region = get_region(cx, cy)
-                    if region:
-                        region_counts[region] += 1
-
-            with lock:
-                shared_data["vehicle"] = region_counts.copy()
-                shared_data["total"] = total_vehicle_count
-                shared_data["accident"]["accident"] = accident_count > 0
-                shared_data["accident"]["accident_count"] = accident_count
-                shared_data["accident"]["ai_confidence"] = confidence
-
-                if shared_data != prev_data:
-                    # log.info(f"Vehicles: {shared_data['vehicle']} | Accident: {shared_data['accident']}")
-                    prev_data = shared_data.copy()
-            
-            webserver.latest_frame = frame.copy()
-
-            annotated = result.plot()
-            annotated = blend_overlay(annotated, region_overlay, alpha=0.5)
+            start = record(timings, "inference", start)
+            frames_processed.inc()
+
+            if detection_log is not None:
+                detection_log.append(time.time(), detections)
+                start = record(timings, "detection_log", start)
+
+            region_counts, total_vehicle_count, accident_count, confidence = count_detections(
+                *detections, region_mask, region_names, class_ids
+            )
+            start = record(timings, "postprocess", start)
+
+            # Tracked counts hold steady through detector flicker
+            if tracker is not None:
+                region_counts, flow = tracker.update(detections, time.monotonic())
+                start = record(timings, "tracking", start)
+
+            shared_data.publish({
+                "vehicle": region_counts,
+                "total": total_vehicle_count,
+                "flow": flow,
+                "accident": {
+                    "accident": accident_count > 0,
+                    "accident_count": accident_count,
+                    "ai_confidence": confidence
+                }
+            })
+            start = record(timings, "publish", start)
+
+        # Annotations are only drawn when a window or a viewer will show them
+        streaming = webserver.has_subscribers()
+        if headless and not streaming:
+            continue
+
+        annotated = draw_detections(frame, detections, detector.names)
+        if annotated.shape == intersection.overlay.shape:
+            blend_overlay(annotated, intersection.overlay, intersection.overlay_bounds, alpha=0.5)
+
+        if streaming:
+            webserver.publish_frame(annotated)
+
+        if not headless:
             cv2.imshow("Live", annotated)
 
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 return
+        record(timings, "render", start)
+
+
+def main(capture, detector_ready):
+    log.info("Starting Threads...")
+    recorder = ClipRecorder(clip_folder, (frame_height, frame_width, 3)) if clip_folder else None
+    detection_log = open_detection_log(detection_log_folder, model.names, (frame_height, frame_width, 3)) if detection_log_folder else None
+    acc_thread = threading.Thread(target=accident.run, args=(shared_data, recorder), daemon=True)
+    dns_thread = threading.Thread(target=density.run, args=(shared_data, registry), daemon=True)
+    wsk_thread = threading.Thread(target=webserver.run, args=("0.0.0.0", 8765, shared_data), daemon=True)
+    acc_thread.start()
+    dns_thread.start()
+    wsk_thread.start()
+    log.info("Threads Started")
+
+    frame_slot = camera.LatestFrame()
+    cap_thread = threading.Thread(target=camera.run, args=(capture, frame_slot), daemon=True)
+    cap_thread.start()
+    detector_ready.set()
+    log.info("Capture Started, Detector Ready")
+
+    try:
+        run_pipeline(frame_slot, model, registry, shared_data, recorder=recorder, detection_log=detection_log)
 
     except Exception:
         log.exception("Unexpected exception occurred")
 
     finally:
+        frame_slot.close()
+        cap_thread.join(timeout=2)
         capture.release()
-        cv2.destroyAllWindows()
+        if recorder is not None:
+            recorder.close()
+        if detection_log is not None:
+            detection_log.close()
+        if not headless:
+            cv2.destroyAllWindows()
         log.info("Capture Released and Resources Cleaned")
 
 
 if __name__ == "__main__":
     try:
-        log.info("Starting Systems and Initializing...")
+        parser = argparse.ArgumentParser(description="TraffIQ Intersection Control")
+        parser.add_argument("--headless", action="store_true", help="run without a local preview window")
+        parser.add_argument("--backend", choices=sorted(BACKENDS), default=model_backend, help="inference backend")
+        parser.add_argument("--model", default=model_path, help=".pt, .onnx or OpenVINO model to load")
+        parser.add_argument("--imgsz", type=int, default=model_input_size, help="model input size")
+        parser.add_argument("--threads", type=int, default=model_threads, help="inference threads, 0 = backend default")
+        parser.add_argument("--roi", action="store_true", help="run the model only on crops around the regions")
+        parser.add_argument("--motion-gate", action="store_true", help="skip inference on frames with no motion in any region")
+        parser.add_argument("--min-rate", type=float, default=motion_min_rate, help="minimum inferences per second with --motion-gate")
+        parser.add_argument("--clips", default=clip_folder, help="folder for accident clips, empty to disable")
+        parser.add_argument("--no-track", action="store_true", help="count raw detections per frame instead of tracked vehicles")
+        parser.add_argument("--controller", choices=sorted(CONTROLLERS), default=traffic.controller_name, help="signal controller")
+        parser.add_argument("--wait-for-model", action="store_true", help="keep the signals off until the detector is ready instead of starting on a fixed-time plan")
+        parser.add_argument("--detection-log", default=detection_log_folder, help="folder to log every frame's detections in, for replay.py")
+        parser.add_argument("--hospitals", default=hospital.hospitals_file, help="CSV of hospitals (name, lat, lng) for the nearest hospital lookup")
+        parser.add_argument("--roads", default=hospital.road_graph_file, help="road graph JSON to rank hospitals by driving distance")
+        parser.add_argument("--intersection", default=intersection_config, help="intersection config: JSON file or firestore:<collection>/<document>, hot-reloaded")
+        args = parser.parse_args()
+        intersection_config = args.intersection
+        degraded_start = not args.wait_for_model
+        traffic.controller_name = args.controller
+        headless = args.headless
+        tracking = not args.no_track
+        clip_folder = args.clips
+        detection_log_folder = args.detection_log
+        hospital.hospitals_file = args.hospitals
+        hospital.road_graph_file = args.roads
+        motion_gating = args.motion_gate
+        motion_min_rate = args.min_rate
 
-        capture_init()
-        traffic.init()
-        database.init()
+        log.info("Starting Systems and Initializing...")
 
-        regions = database.get_intersection_data()
+        startup = Startup()
+        startup.start("serial", traffic.init)
+        startup.start("database", database.init)
+        startup.start("camera", open_camera)
+        startup.start("model", load_model, args.backend, args.model, args.imgsz, args.threads)
+
+        if intersection_config and intersection_config.startswith("firestore:"):
+            startup.result("database")
+        registry = IntersectionRegistry(intersection_config, (frame_height, frame_width, 3))
+        registry.watch()
+        shared_data = StateStore(initial_state(registry.get().regions))
+        detector_ready = threading.Event()
+
+        startup.result("serial")
+        if degraded_start:
+            start_traffic(shared_data, registry, detector_ready)
+            log.info("Signals Running on Fixed-Time Plan Until the Detector is Ready")
+
+        startup.result("database")
+        capture = startup.result("camera")
+        model = startup.result("model")
+        if args.roi:
+            model = RoiDetector(model, registry.get().regions, (frame_height, frame_width, 3))
+            log.info(f"Inference limited to {len(model.tiles)} region crop(s)")
+        startup.report()
+
+        if not degraded_start:
+            start_traffic(shared_data, registry, detector_ready)
 
-        shared_data = {
-            "vehicle": {region : 0 for region in regions.keys()},
-            "total" : 0,
-            "accident": {"accident": False, "accident_count": 0, "ai_confidence" : 0}
-        }
-        
         log.info("Systems Initialized")
-        main()
+        main(capture, detector_ready)
 
     except KeyboardInterrupt:
         log.critical("User Commanded Immediate Shut Down")
@@ -204,4 +355,5 @@ if __name__ == "__main__":
 
     finally:
         traffic.close_arduino()
+        database.close()
         log.info("Safely Shutting Down...")
@@ -0,0 +1,152 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: metrics.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    In-process counters, gauges and latency histograms for every stage of
+    the intersection controller, rendered in the Prometheus text format.
+    Updating a metric is an increment under a small lock, cheap enough to
+    leave on all the time. The text is served at /metrics by webserver.py.
+================================================================================
+"""
+
+
+import time
+import bisect
+import threading
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+registry = []
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self):
+        return []
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=None):
+        super().__init__(name, help, labels)
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name, self.labels, self.value)]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=None, fn=None):
+        # `fn`, when given, is called at scrape time for the current value
+        super().__init__(name, help, labels)
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, self.labels, self.fn() if self.fn else self.value)]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+
+    def time(self):
+        return Timer(self)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.total
+
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            samples.append((f"{self.name}_bucket", {**self.labels, "le": bound}, cumulative))
+
+        cumulative += counts[-1]
+        samples.append((f"{self.name}_bucket", {**self.labels, "le": "+Inf"}, cumulative))
+        samples.append((f"{self.name}_sum", self.labels, total))
+        samples.append((f"{self.name}_count", self.labels, cumulative))
+        return samples
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def render():
+    # Samples of one metric family must be contiguous, so group by name
+    families = {}
+    for metric in list(registry):
+        families.setdefault(metric.name, []).append(metric)
+
+    lines = []
+    for name, metrics in families.items():
+        lines.append(f"# HELP {name} {metrics[0].help}")
+        lines.append(f"# TYPE {name} {metrics[0].kind}")
+
+        for metric in metrics:
+            for sample, labels, value in metric.samples():
+                lines.append(f"{sample}{label_text(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+stages = {}
+stages_lock = threading.Lock()
+
+
+def stage(name):
+    # Shared per-stage latency histogram, one label value per pipeline stage
+    with stages_lock:
+        if name not in stages:
+            stages[name] = Histogram("traffiq_stage_seconds", "Latency of each pipeline stage", {"stage": name})
+        return stages[name]
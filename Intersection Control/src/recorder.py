@@ -0,0 +1,168 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: recorder.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Accident clip recorder. Keeps the last few seconds of camera frames as
+    JPEGs in a preallocated ring buffer, so memory use is fixed. When an
+    accident is logged, the frames from `pre_roll` seconds before it to
+    `post_roll` seconds after it are written to a video clip plus a
+    thumbnail, and their paths are added to the accident record.
+
+    The pipeline thread only downscales the frame it hands over; JPEG
+    encoding happens on the recorder thread and clip writing on a separate
+    export thread, so neither stalls capture or inference.
+================================================================================
+"""
+
+
+import os
+import math
+import time
+import threading
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy
+
+import database
+import metrics
+
+
+clips_written = metrics.Counter("traffiq_accident_clips_total", "Accident clips written to disk")
+frames_oversize = metrics.Counter("traffiq_preroll_oversize_total", "Pre-roll frames too large for a ring slot")
+clip_encode = metrics.stage("clip_encode")
+
+
+class ClipRecorder:
+    def __init__(self, folder, frame_shape, pre_roll=10.0, post_roll=5.0, fps=10.0, scale=0.5, quality=70):
+        height, width = frame_shape[:2]
+        self.folder = folder
+        self.size = (round(width * scale), round(height * scale))
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.quality = quality
+
+        # One slot per stored frame, sized well above a typical JPEG of it
+        self.slots = math.ceil((pre_roll + post_roll + 1) * fps)
+        self.slot_bytes = self.size[0] * self.size[1] * 3 // 4
+        self.ring = numpy.empty((self.slots, self.slot_bytes), dtype=numpy.uint8)
+        self.lengths = numpy.zeros(self.slots, dtype=numpy.int64)
+        self.times = numpy.zeros(self.slots)
+        self.count = 0
+
+        self.cond = threading.Condition()
+        self.pending = None
+        self.pending_time = 0.0
+        self.next_offer = 0.0
+        self.triggers = []
+        self.closed = False
+
+        os.makedirs(folder, exist_ok=True)
+        self.exporter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-export")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def offer(self, frame, now=None):
+        # Called from the pipeline for every frame; keeps at most `fps` of them
+        now = time.time() if now is None else now
+        if now < self.next_offer:
+            return
+        self.next_offer = max(self.next_offer + 1 / self.fps, now - 1 / self.fps)
+
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        with self.cond:
+            self.pending, self.pending_time = small, now
+            self.cond.notify()
+
+    def trigger(self, document_id, now=None):
+        now = time.time() if now is None else now
+        with self.cond:
+            self.triggers.append((now, document_id))
+            self.cond.notify()
+
+    def store(self, frame, stamp):
+        with clip_encode.time():
+            success, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not success:
+            return
+        if len(jpeg) > self.slot_bytes:
+            frames_oversize.inc()
+            return
+
+        slot = self.count % self.slots
+        self.ring[slot, :len(jpeg)] = jpeg.ravel()
+        self.lengths[slot] = len(jpeg)
+        self.times[slot] = stamp
+        self.count += 1
+
+    def collect(self, start, end):
+        # JPEG bytes and times of the stored frames inside [start, end], oldest first
+        frames = []
+        for seq in range(max(0, self.count - self.slots), self.count):
+            slot = seq % self.slots
+            if start <= self.times[slot] <= end:
+                frames.append((self.times[slot], self.ring[slot, :self.lengths[slot]].tobytes()))
+        return frames
+
+    def export_due(self, now):
+        with self.cond:
+            due = [entry for entry in self.triggers if self.closed or now >= entry[0] + self.post_roll]
+            self.triggers = [entry for entry in self.triggers if entry not in due]
+
+        for moment, document_id in due:
+            frames = self.collect(moment - self.pre_roll, moment + self.post_roll)
+            if frames:
+                self.exporter.submit(self.write, document_id, moment, frames)
+            else:
+                log.warning(f"No Pre-Roll Frames for Accident {document_id}")
+
+    def write(self, document_id, moment, frames):
+        try:
+            clip_path = os.path.join(self.folder, f"{document_id}.avi")
+            thumb_path = os.path.join(self.folder, f"{document_id}.jpg")
+
+            # Play back at the rate the frames were actually stored
+            span = frames[-1][0] - frames[0][0]
+            fps = min(self.fps, (len(frames) - 1) / span) if span > 0 else self.fps
+            writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*"MJPG"), max(fps, 1.0), self.size)
+            for _, jpeg in frames:
+                writer.write(cv2.imdecode(numpy.frombuffer(jpeg, dtype=numpy.uint8), cv2.IMREAD_COLOR))
+            writer.release()
+
+            # The stored frame nearest the accident is already a JPEG
+            _, thumbnail = min(frames, key=lambda entry: abs(entry[0] - moment))
+            with open(thumb_path, "wb") as file:
+                file.write(thumbnail)
+
+            database.update_data("accident_data", document_id, {"clip": clip_path, "thumbnail": thumb_path})
+            clips_written.inc()
+            log.info(f"Saved Accident Clip {clip_path} ({len(frames)} Frames)")
+
+        except Exception:
+            log.exception(f"Failed to Save Accident Clip for {document_id}")
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None or self.closed, timeout=0.5)
+                frame, stamp, self.pending = self.pending, self.pending_time, None
+                closed = self.closed
+
+            if frame is not None:
+                self.store(frame, stamp)
+            self.export_due(time.time())
+            if closed:
+                break
+
+    def close(self):
+        # Pending accidents are exported with whatever post-roll was recorded
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join(timeout=5)
+        self.exporter.shutdown(wait=True)
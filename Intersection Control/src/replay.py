@@ -0,0 +1,280 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: replay.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Re-runs the signal and accident logic on a detection log recorded with
+    --detection-log (see detection_log.py), without the camera or model.
+
+    traffic.run runs unchanged on a clock that follows the log: each time
+    it sleeps until its next phase switch, the frames logged up to then are
+    counted, checked by accident.new_accident and published, and the loop
+    wakes straight away. Without tracking, the region counts of a whole
+    config's worth of frames are computed in one vectorized pass, so hours
+    of log replay in seconds. The Arduino is replaced by a recorder of the
+    lights, which measures how long each region was green and how many
+    vehicle-seconds it spent at red.
+
+    The log is open-loop: the traffic it shows reacted to the signals that
+    ran when it was recorded, so compare controllers by where their greens
+    go rather than by absolute delay (simulate.py models the feedback).
+
+    Usage:
+        python replay.py ../detection_logs/20250101_080000 --controllers fixed,pressure
+        python replay.py ../detection_logs/20250101_080000 --real-confidence 40 --speed 60
+================================================================================
+"""
+
+
+import json
+import time
+import argparse
+import datetime
+import logging as log
+
+import numpy
+
+import traffic
+import accident
+import database
+from state import StateStore, initial_state
+from main import count_detections
+from tracker import Tracker, empty_flow
+from controller import CONTROLLERS, create_controller
+from intersection import IntersectionRegistry
+from detection_log import DetectionLog
+
+
+class EndOfLog(Exception):
+    pass
+
+
+class ReplayClock:
+    # Stands in for the time module in traffic.run
+    def __init__(self, replay):
+        self.replay = replay
+
+    def time(self):
+        return self.replay.now
+
+    def sleep(self, seconds):
+        self.replay.advance(self.replay.now + seconds)
+
+
+class SignalRecorder:
+    # Takes the place of the Arduino link: keeps the lights of every unit
+    def __init__(self):
+        self.lights = {}
+        self.switches = 0
+
+    def set_signals(self, changes):
+        self.lights.update(changes)
+        self.switches += 1
+
+    def close(self):
+        pass
+
+
+def count_frames(log_data, start, stop, region_mask, region_count, class_ids):
+    # count_detections for frames [start, stop) at once: region counts,
+    # totals, accident counts and accident confidences, one row per frame
+    frames = stop - start
+    first, last = log_data.starts[start], log_data.ends[stop - 1]
+    frame = numpy.repeat(numpy.arange(frames), log_data.ends[start:stop] - log_data.starts[start:stop])
+    classes = log_data.classes[first:last].astype(numpy.intp)
+
+    is_accident = classes == class_ids.get("accident", -1)
+    is_vehicle = classes == class_ids.get("objects", -1)
+
+    vehicles = log_data.boxes[first:last][is_vehicle].astype(numpy.intp)
+    cx = (vehicles[:, 0] + vehicles[:, 2]) // 2
+    cy = (vehicles[:, 1] + vehicles[:, 3]) // 2
+    height, width = region_mask.shape
+    inside = (cx >= 0) & (cx < width) & (cy >= 0) & (cy < height)
+
+    vehicle_frame = frame[is_vehicle]
+    labels = region_mask[cy[inside], cx[inside]].astype(numpy.intp)
+    counts = numpy.bincount(
+        vehicle_frame[inside] * (region_count + 1) + labels, minlength=frames * (region_count + 1)
+    ).reshape(frames, region_count + 1)[:, 1:]
+    totals = numpy.bincount(vehicle_frame, minlength=frames)
+
+    # The confidence of a frame's last accident box, as count_detections reports
+    accident_frame = frame[is_accident]
+    accident_counts = numpy.bincount(accident_frame, minlength=frames)
+    confidences = numpy.zeros(frames)
+    if len(accident_frame):
+        last_box = numpy.append(accident_frame[1:] != accident_frame[:-1], True)
+        confs = log_data.confs[first:last][is_accident].astype(numpy.float64)
+        confidences[accident_frame[last_box]] = confs[last_box] * 100
+
+    return counts, totals, accident_counts, confidences
+
+
+class Replay:
+    def __init__(self, log_data, tracking=True, speed=0.0):
+        self.log = log_data
+        self.tracking = tracking
+        self.speed = speed
+        self.class_ids = {name: class_id for class_id, name in log_data.names.items()}
+
+        changes = log_data.config_changes() or [(0, {"regions": database.get_intersection_data()})]
+        self.changes = dict(changes[1:])
+        self.registry = IntersectionRegistry(frame_shape=log_data.frame_shape, config=changes[0][1])
+        self.shared_data = StateStore(initial_state(self.registry.get().regions))
+        self.signals = SignalRecorder()
+
+        self.index = 0
+        self.now = self.last = float(log_data.times[0])
+        self.data = None
+        self.accidents = []
+        self.green_seconds = {}
+        self.red_vehicle_seconds = {}
+        self.load(self.registry.get(), 0)
+
+    def load(self, intersection, start):
+        # Per config: the mask, a fresh tracker, or the precomputed counts
+        # of every frame up to the next config change
+        self.intersection = intersection
+        self.segment = start
+        self.tracker = None
+        self.counts = None
+        if self.tracking:
+            self.tracker = Tracker(intersection.mask, intersection.region_names, self.class_ids.get("objects", -1))
+            return
+
+        stop = min([frame for frame in self.changes if frame > start] + [len(self.log)])
+        self.counts = count_frames(self.log, start, stop, intersection.mask, len(intersection.region_names), self.class_ids)
+
+    def state(self, i, now):
+        region_names = self.intersection.region_names
+        flow = empty_flow(region_names)
+        if self.tracker is not None:
+            _, detections = self.log.frame(i)
+            region_counts, total, accident_count, confidence = count_detections(
+                *detections, self.intersection.mask, region_names, self.class_ids
+            )
+            region_counts, flow = self.tracker.update(detections, now)
+        else:
+            counts, totals, accident_counts, confidences = self.counts
+            row = i - self.segment
+            region_counts = dict(zip(region_names, counts[row].tolist()))
+            total, accident_count, confidence = int(totals[row]), int(accident_counts[row]), float(confidences[row])
+
+        return {
+            "vehicle": region_counts,
+            "total": total,
+            "flow": flow,
+            "accident": {
+                "accident": accident_count > 0,
+                "accident_count": accident_count,
+                "ai_confidence": confidence
+            }
+        }
+
+    def account(self, until):
+        # What the signals did with the traffic since the last frame
+        seconds = until - self.last
+        if self.data is not None and seconds > 0:
+            for region, count in self.data["vehicle"].items():
+                red, _, green = self.signals.lights.get(self.intersection.signals[region], (True, False, False))
+                if green:
+                    self.green_seconds[region] = self.green_seconds.get(region, 0.0) + seconds
+                if red:
+                    self.red_vehicle_seconds[region] = self.red_vehicle_seconds.get(region, 0.0) + count * seconds
+        self.last = until
+
+    def advance(self, until):
+        if self.speed:
+            time.sleep(max(0.0, until - self.now) / self.speed)
+
+        times = self.log.times
+        while self.index < len(self.log) and times[self.index] <= until:
+            i, now = self.index, float(times[self.index])
+            self.account(now)
+            if i in self.changes and self.registry.apply(self.changes[i]):
+                self.load(self.registry.get(), i)
+
+            self.data = self.state(i, now)
+            if accident.new_accident(self.data, now):
+                record = accident.accident_record(self.data)
+                self.accidents.append({
+                    "time": datetime.datetime.fromtimestamp(now, datetime.timezone.utc).isoformat(),
+                    "severity": record["severity"],
+                    "ai_conf": round(record["ai_conf"], 1),
+                    "real": record["real"]
+                })
+            self.index += 1
+
+        if self.data is not None:
+            self.shared_data.publish(self.data)
+        if self.index >= len(self.log):
+            raise EndOfLog()
+
+        self.account(until)
+        self.now = until
+
+    def run(self, controller_name):
+        accident.active_accident = False
+        traffic.arduino = self.signals
+
+        try:
+            self.advance(self.now)
+            traffic.run(
+                self.shared_data, self.registry,
+                lambda intersection: create_controller(controller_name, intersection.phase_order, intersection.timing),
+                clock=ReplayClock(self)
+            )
+
+        except EndOfLog:
+            pass
+
+
+def rounded(values):
+    return {key: round(value, 1) for key, value in values.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a TraffIQ detection log through the signal and accident logic")
+    parser.add_argument("log", help="detection log folder")
+    parser.add_argument("--controllers", default=traffic.controller_name, help="comma separated controllers to replay")
+    parser.add_argument("--real-confidence", type=float, default=accident.real_confidence, help="AI confidence above which an accident is marked real")
+    parser.add_argument("--no-track", action="store_true", help="count raw detections per frame instead of tracked vehicles")
+    parser.add_argument("--speed", type=float, default=0, help="times real time, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    log.getLogger().setLevel(log.WARNING)
+    accident.real_confidence = args.real_confidence
+    log_data = DetectionLog(args.log)
+    if not len(log_data):
+        parser.error("the detection log has no frames")
+
+    report = {
+        "log": args.log,
+        "frames": len(log_data),
+        "detections": int(log_data.ends[-1]),
+        "duration_s": round(float(log_data.times[-1] - log_data.times[0]), 1),
+        "controllers": {}
+    }
+    for name in args.controllers.split(","):
+        if name not in CONTROLLERS:
+            parser.error(f"unknown controller {name}")
+
+        start = time.perf_counter()
+        replay = Replay(log_data, tracking=not args.no_track, speed=args.speed)
+        replay.run(name)
+        elapsed = time.perf_counter() - start
+
+        report["controllers"][name] = {
+            "wall_s": round(elapsed, 2),
+            "speedup": round(report["duration_s"] / elapsed, 1),
+            "switches": replay.signals.switches,
+            "green_s": rounded(replay.green_seconds),
+            "red_vehicle_s": rounded(replay.red_vehicle_seconds),
+            "red_vehicle_s_total": round(sum(replay.red_vehicle_seconds.values()), 1)
+        }
+        report["accidents"] = replay.accidents
+
+    print(json.dumps(report, indent=2))
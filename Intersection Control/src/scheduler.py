@@ -0,0 +1,78 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: scheduler.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Motion-gated inference scheduling. Each frame is shrunk to a small
+    grayscale image and compared with the one the model last ran on; the
+    share of changed pixels is measured per region. When no region has
+    changed enough the frame skips inference and the last detections are
+    reused. A full inference is still forced at a minimum rate so a
+    stationary accident is never missed.
+================================================================================
+"""
+
+
+import time
+
+import cv2
+import numpy
+
+import metrics
+
+
+gate_skipped = metrics.Counter("traffiq_motion_gate_frames_total", "Frames seen by the motion gate", {"result": "skipped"})
+gate_inferred = metrics.Counter("traffiq_motion_gate_frames_total", "Frames seen by the motion gate", {"result": "inferred"})
+
+
+class MotionGate:
+    def __init__(self, region_mask, scale=0.125, pixel_threshold=25, motion_threshold=0.02, min_rate=1.0):
+        # region_mask: frame-sized label image from intersection.create_region_mask
+        height, width = region_mask.shape
+        self.size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        self.labels = cv2.resize(region_mask, self.size, interpolation=cv2.INTER_NEAREST).ravel()
+        self.regions = int(self.labels.max())
+        self.region_pixels = numpy.maximum(numpy.bincount(self.labels, minlength=self.regions + 1), 1)
+
+        self.pixel_threshold = pixel_threshold
+        self.motion_threshold = motion_threshold
+        self.max_gap = 1 / min_rate if min_rate else float("inf")
+
+        self.reference = None
+        self.last_inference = 0.0
+        self.scores = numpy.zeros(self.regions)
+        self.skipped = 0
+        self.inferred = 0
+
+    def small(self, frame):
+        gray = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+
+    def should_infer(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        small = self.small(frame)
+
+        if self.reference is None or now - self.last_inference >= self.max_gap:
+            changed = True
+        else:
+            moving = (cv2.absdiff(small, self.reference) > self.pixel_threshold).ravel()
+            counts = numpy.bincount(self.labels[moving], minlength=self.regions + 1)
+            self.scores = (counts / self.region_pixels)[1:]
+            changed = bool((self.scores > self.motion_threshold).any())
+
+        if changed:
+            self.reference = small
+            self.last_inference = now
+            self.inferred += 1
+            gate_inferred.inc()
+        else:
+            self.skipped += 1
+            gate_skipped.inc()
+
+        return changed
+
+    def skip_ratio(self):
+        total = self.skipped + self.inferred
+        return self.skipped / total if total else 0.0
@@ -0,0 +1,143 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: serial_link.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Serial link to the signal Arduino. The whole intersection state is
+    sent as one framed message from a dedicated writer thread and
+    confirmed by the Arduino's acknowledgement instead of fixed sleeps.
+
+    Frame:  $<SEQ><STATES>*<CHECKSUM>\n
+        - SEQ     : two hex digits, echoed back in the reply
+        - STATES  : one digit per signal unit starting at A, the bits
+                    being 1 = Red, 2 = Yellow, 4 = Green
+        - CHECKSUM: two hex digits, XOR of every character between
+                    '$' and '*'
+    Reply:  ACK <SEQ>  or  NAK <SEQ>
+================================================================================
+"""
+
+
+import time
+import queue
+import threading
+import logging as log
+
+import serial
+
+import metrics
+
+
+serial_write = metrics.stage("serial_write")
+frames_acked = metrics.Counter("traffiq_signal_frames_total", "Signal frames sent to the Arduino", {"result": "acked"})
+frames_failed = metrics.Counter("traffiq_signal_frames_total", "Signal frames sent to the Arduino", {"result": "failed"})
+
+
+ack_timeout = 0.25
+send_retries = 3
+
+
+def encode_state(red: bool, yellow: bool, green: bool):
+    return int(red) | int(yellow) << 1 | int(green) << 2
+
+
+def encode_frame(seq: int, states: dict):
+    # Units without a known state are held at red
+    units = max(ord(signal) - ord("A") for signal in states) + 1
+    digits = "".join(
+        str(states.get(chr(ord("A") + unit), encode_state(True, False, False)))
+        for unit in range(units)
+    )
+    payload = f"{seq:02X}{digits}"
+
+    checksum = 0
+    for char in payload:
+        checksum ^= ord(char)
+
+    return f"${payload}*{checksum:02X}\n".encode()
+
+
+class SignalLink:
+    def __init__(self, port=None, baudrate=9600, device=None):
+        # `device` may be any already open serial-like object (e.g. a fake)
+        self.serial = device or serial.Serial(port=port, baudrate=baudrate, timeout=ack_timeout)
+        self.states = {}
+        self.pending = queue.Queue()
+        self.seq = 0
+        self.acked = 0
+        self.failed = 0
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+    def set_signals(self, changes: dict):
+        # changes: {signal: (red, yellow, green)}. Returns immediately.
+        for signal, (red, yellow, green) in changes.items():
+            self.states[signal] = encode_state(red, yellow, green)
+        self.pending.put(dict(self.states))
+
+    def wait_ack(self, seq):
+        deadline = time.monotonic() + ack_timeout
+        expected = f"{seq:02X}"
+
+        while time.monotonic() < deadline:
+            reply = self.serial.readline().decode(errors="ignore").strip()
+            if reply == f"ACK {expected}":
+                return True
+            if reply == f"NAK {expected}":
+                return False
+
+        return False
+
+    def send(self, states):
+        self.seq = (self.seq + 1) % 256
+        frame = encode_frame(self.seq, states)
+        start = time.perf_counter()
+
+        for attempt in range(send_retries):
+            try:
+                self.serial.reset_input_buffer()
+                self.serial.write(frame)
+                if self.wait_ack(self.seq):
+                    self.acked += 1
+                    frames_acked.inc()
+                    serial_write.observe(time.perf_counter() - start)
+                    return True
+
+            except serial.SerialException as e:
+                log.error(f"Arduino write failed: {e}")
+
+        self.failed += 1
+        frames_failed.inc()
+        log.error(f"Arduino did not acknowledge signal frame {frame.strip()!r}")
+        return False
+
+    def run(self):
+        stopping = False
+
+        while not stopping:
+            states = self.pending.get()
+
+            # Only the newest intersection state matters
+            while not self.pending.empty():
+                newer = self.pending.get_nowait()
+                if newer is None:
+                    stopping = True
+                else:
+                    states = newer
+
+            if states is None:
+                break
+
+            # The writer must outlive any one bad frame or port error
+            try:
+                self.send(states)
+
+            except Exception:
+                log.exception("Signal Link Send Failed")
+
+    def close(self):
+        self.pending.put(None)
+        self.writer.join(timeout=send_retries * ack_timeout + 1)
+        self.serial.close()
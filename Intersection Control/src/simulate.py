@@ -0,0 +1,167 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: simulate.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Offline intersection simulator for comparing the signal controllers in
+    controller.py before deploying one. Many independent runs advance
+    together as rows of numpy arrays in one-second steps: Poisson arrivals
+    join each approach's queue, the green approach discharges at the
+    saturation flow, and each controller is only consulted when one of its
+    runs reaches a phase boundary, with the same phase sequence as
+    traffic.run (green, yellow_stop, yellow_start).
+
+    Every controller sees the same arrivals (same seed). Reports average
+    delay per vehicle, throughput and the queue left at the end.
+
+    Usage:
+        python simulate.py --rates 0.12,0.05,0.02
+        python simulate.py --pattern ../arrivals.csv --bin-seconds 300 --runs 500
+    A pattern CSV has the region names as header and one row of arrival
+    rates (vehicles per second) per bin, replayed in order.
+================================================================================
+"""
+
+
+import csv
+import json
+import time
+import argparse
+
+import numpy
+
+from controller import CONTROLLERS, create_controller
+
+
+def load_pattern(path):
+    with open(path) as file:
+        rows = list(csv.reader(file))
+    return rows[0], numpy.array(rows[1:], dtype=float)
+
+
+def snapshot(names, queue, waiting):
+    # The fields of shared_data the controllers read, for one run
+    return {
+        "vehicle": {name: int(count) for name, count in zip(names, queue)},
+        "flow": {
+            name: {"queue": int(count), "wait": float(total / count) if count else 0.0}
+            for name, count, total in zip(names, queue, waiting)
+        }
+    }
+
+
+def simulate(controller_name, names, rates, bin_seconds, duration, runs, saturation_flow=0.5, yellow_time=2, seed=0):
+    regions = len(names)
+    rng = numpy.random.default_rng(seed)
+    controllers = [create_controller(controller_name, names) for _ in range(runs)]
+    rows = numpy.arange(runs)
+
+    queue = numpy.zeros((runs, regions))
+    waiting = numpy.zeros((runs, regions))  # vehicle-seconds spent by the current queue
+    credit = numpy.zeros((runs, regions))
+    delay = numpy.zeros(runs)
+    served = numpy.zeros(runs)
+    arrived = numpy.zeros(runs)
+
+    # Phase 0 green, 1 yellow_stop, 2 yellow_start
+    green = numpy.zeros(runs, dtype=numpy.intp)
+    upcoming = numpy.zeros(runs, dtype=numpy.intp)
+    phase = numpy.zeros(runs, dtype=numpy.int8)
+    green_start = numpy.zeros(runs)
+    phase_end = numpy.array([
+        controllers[k].green_time(names[0], snapshot(names, queue[k], waiting[k])) for k in range(runs)
+    ], dtype=float)
+
+    for step in range(int(duration)):
+        now = step + 1.0
+        rate = rates[min(int(step // bin_seconds), len(rates) - 1)]
+        arrivals = rng.poisson(rate, (runs, regions))
+        queue += arrivals
+        arrived += arrivals.sum(axis=1)
+
+        # Green approaches discharge one vehicle per 1 / saturation_flow seconds
+        serving = numpy.zeros((runs, regions), dtype=bool)
+        serving[rows, green] = phase == 0
+        credit = numpy.where(serving, numpy.minimum(credit + saturation_flow, 1 + saturation_flow), 0.0)
+        leaving = numpy.minimum(queue, numpy.floor(credit))
+        credit -= leaving
+
+        share = numpy.divide(leaving, queue, out=numpy.zeros_like(queue), where=queue > 0)
+        waiting -= waiting * share
+        queue -= leaving
+        waiting += queue
+        delay += queue.sum(axis=1)
+        served += leaving.sum(axis=1)
+
+        for k in numpy.flatnonzero(phase_end <= now).tolist():
+            data = snapshot(names, queue[k], waiting[k])
+            current = names[green[k]]
+
+            if phase[k] == 0:
+                elapsed = now - green_start[k]
+                chosen = names.index(controllers[k].next_green(current, data, elapsed))
+                if chosen == green[k]:
+                    phase_end[k] = now + controllers[k].green_time(current, data, elapsed)
+                else:
+                    upcoming[k] = chosen
+                    phase[k] = 1
+                    phase_end[k] = now + yellow_time
+
+            elif phase[k] == 1:
+                phase[k] = 2
+                phase_end[k] = now + yellow_time
+
+            else:
+                green[k] = upcoming[k]
+                green_start[k] = now
+                phase[k] = 0
+                phase_end[k] = now + controllers[k].green_time(names[green[k]], data)
+
+    return {
+        "delay_s": delay / numpy.maximum(arrived, 1),
+        "throughput_vph": served / duration * 3600,
+        "left_in_queue": queue.sum(axis=1)
+    }
+
+
+def summarize(values):
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p10": round(float(numpy.percentile(values, 10)), 2),
+        "p90": round(float(numpy.percentile(values, 90)), 2)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare TraffIQ signal controllers on simulated traffic")
+    parser.add_argument("--controllers", default=",".join(CONTROLLERS), help="comma separated controllers to compare")
+    parser.add_argument("--regions", default="A,B,C", help="approach names, with --rates")
+    parser.add_argument("--rates", default="0.12,0.05,0.02", help="arrivals per second for each approach")
+    parser.add_argument("--pattern", help="CSV of arrival rates over time, overrides --regions / --rates")
+    parser.add_argument("--bin-seconds", type=float, default=60, help="seconds covered by each pattern row")
+    parser.add_argument("--duration", type=float, default=3600, help="simulated seconds per run")
+    parser.add_argument("--runs", type=int, default=200, help="independent runs per controller")
+    parser.add_argument("--saturation-flow", type=float, default=0.5, help="vehicles per second leaving a green approach")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.pattern:
+        names, rates = load_pattern(args.pattern)
+    else:
+        names = args.regions.split(",")
+        rates = numpy.array([[float(rate) for rate in args.rates.split(",")]])
+        if rates.shape[1] != len(names):
+            parser.error("--rates needs one rate per region")
+
+    report = {"regions": names, "duration_s": args.duration, "runs": args.runs, "controllers": {}}
+    for name in args.controllers.split(","):
+        start = time.perf_counter()
+        results = simulate(name, names, rates, args.bin_seconds, args.duration, args.runs, args.saturation_flow, seed=args.seed)
+        elapsed = time.perf_counter() - start
+
+        report["controllers"][name] = {key: summarize(values) for key, values in results.items()}
+        report["controllers"][name]["speedup"] = round(args.duration * args.runs / elapsed)
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,55 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: startup.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Startup orchestrator. The slow steps of bringing an intersection up
+    (loading and warming the model, opening the camera, connecting to the
+    Arduino, initializing Firestore) are independent, so they run in
+    parallel and each one is waited for only where it is needed. Every
+    step's duration is logged and kept as a gauge on /metrics.
+================================================================================
+"""
+
+
+import time
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class Startup:
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(thread_name_prefix="startup")
+        self.steps = {}
+        self.timings = {}
+        self.began = time.perf_counter()
+
+    def timed(self, name, fn, args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            metrics.Gauge("traffiq_startup_seconds", "Time taken by each startup step", {"step": name}).set(self.timings[name])
+            log.info(f"Startup: {name} took {self.timings[name]:.2f}s")
+
+    def start(self, name, fn, *args):
+        self.steps[name] = self.pool.submit(self.timed, name, fn, args)
+
+    def result(self, name, timeout=None):
+        # Re-raises whatever the step raised, SystemExit included
+        return self.steps[name].result(timeout)
+
+    def done(self, name):
+        return self.steps[name].done()
+
+    def report(self):
+        total = time.perf_counter() - self.began
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+        log.info(f"Startup Finished in {total:.2f}s ({steps})")
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,73 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: state.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Versioned store for the detection state shared between the inference
+    loop and the traffic / accident threads. Every publish replaces an
+    immutable snapshot and bumps the version, and consumers block on a
+    condition until a newer version exists instead of polling.
+================================================================================
+"""
+
+
+import time
+import threading
+from types import MappingProxyType
+
+import metrics
+from tracker import empty_flow
+
+
+lock_hold = metrics.stage("state_lock")
+
+
+def freeze(data):
+    if isinstance(data, dict):
+        return MappingProxyType({key: freeze(value) for key, value in data.items()})
+    return data
+
+
+def initial_state(regions):
+    return {
+        "vehicle": {region : 0 for region in regions.keys()},
+        "total" : 0,
+        "flow": empty_flow(regions.keys()),
+        "accident": {"accident": False, "accident_count": 0, "ai_confidence" : 0}
+    }
+
+
+class StateStore:
+    def __init__(self, initial: dict):
+        self.cond = threading.Condition()
+        self.version = 1
+        self.snapshot = freeze(initial)
+
+    def publish(self, data: dict):
+        # Only a real change produces a new version, so waiters are not
+        # woken for frames that detected the same thing as the last one.
+        frozen = freeze(data)
+        with self.cond:
+            start = time.perf_counter()
+            if frozen == self.snapshot:
+                lock_hold.observe(time.perf_counter() - start)
+                return self.version
+
+            self.snapshot = frozen
+            self.version += 1
+            self.cond.notify_all()
+            lock_hold.observe(time.perf_counter() - start)
+            return self.version
+
+    def get(self):
+        with self.cond:
+            return self.version, self.snapshot
+
+    def wait(self, version, timeout=None):
+        # Returns the first snapshot newer than `version`, or the current one
+        # if the timeout expires first.
+        with self.cond:
+            self.cond.wait_for(lambda: self.version > version, timeout)
+            return self.version, self.snapshot
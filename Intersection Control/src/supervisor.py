@@ -0,0 +1,331 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: supervisor.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Runs several camera pipelines on one box. Every camera gets its own
+    process with its own regions, Arduino, traffic and accident threads and
+    websocket port, pinned to its own CPU core where the OS allows it. The
+    model is loaded once per inference worker instead of once per camera:
+    every camera captures straight into its own SharedFrameBuffer and
+    queues a small request naming the frame and crop, and a worker copies
+    the pixels out and batches the requests waiting from several cameras
+    into one detect_batch call.
+
+    Config (JSON, default ../cameras.json):
+        {
+            "model": {"backend": "onnx", "path": "../custom_yolo.onnx",
+                      "imgsz": 640, "threads": 0},
+            "workers": 1, "max_batch": 4, "batch_window_ms": 5,
+            "cameras": [
+                {"name": "north", "source": 0, "serial_port": "COM6",
+                 "ws_port": 8765, "width": 1280, "height": 720,
+                 "location": [12.312735, 76.583278], "roi": false,
+                 "regions": {"A": [[0, 205], [0, 375], [250, 375], [250, 205]]}}
+            ]
+        }
+    "regions" may be left out to use database.get_intersection_data(), or
+    "intersection" may name a hot-reloaded config file (see intersection.py).
+    Accident clips go to "clips" (default ../accident_clips/<name>), and
+    "controller" picks the signal controller (default "fixed"), and
+    "hospitals" / "roads" the nearest hospital data (see hospital.py).
+    Each camera's frame buffer gets enough slots for its "fps" (default 30)
+    to keep a frame intact for "max_latency_ms" (default 500), the longest
+    a request may wait for a worker: the batch window plus a batch already
+    in the model.
+    "detection_log" names a folder to log detections in for replay.py.
+================================================================================
+"""
+
+
+import os
+import json
+import math
+import time
+import queue
+import argparse
+import threading
+import logging as log
+import multiprocessing
+
+import numpy
+
+import main
+import camera
+import traffic
+import accident
+import database
+import density
+import hospital
+import webserver
+from state import StateStore, initial_state
+from detector import RoiDetector, create_detector
+from frame_buffer import SharedFrameBuffer
+from recorder import ClipRecorder
+from intersection import IntersectionRegistry
+
+
+config_path = "../cameras.json"
+result_timeout = 5.0
+camera_fps = 30
+max_latency_ms = 500
+
+
+def pin(cpus):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+
+def plan_cores(cameras, workers):
+    # One core per camera from the top, the rest shared by the inference
+    # workers. Without enough cores nothing is pinned.
+    cores = os.cpu_count() or 1
+    if cores < cameras + workers:
+        return [None] * cameras, None
+
+    camera_cores = [{cores - 1 - i} for i in range(cameras)]
+    worker_cores = set(range(cores - cameras))
+    return camera_cores, worker_cores
+
+
+class RemoteDetector:
+    # Detector stand-in for a camera process. Frames (or crops of them) are
+    # views into this camera's SharedFrameBuffer, so only their location
+    # is sent and a worker process copies the pixels out of shared memory.
+    def __init__(self, name, frames, frame_slot, names, requests, results):
+        self.name = name
+        self.names = names
+        self.frames = frames
+        self.frame_slot = frame_slot
+        self.requests = requests
+        self.results = results
+        self.request_id = 0
+
+    def __call__(self, frame):
+        location = self.frames.locate(frame)
+        if location is None:
+            raise ValueError("Frame is not in the shared frame buffer")
+
+        # The pipeline works on one frame at a time, so the frame (or crop)
+        # being detected is the one it last took from the slot
+        slot, y, x = location
+        seq = self.frame_slot.read_seq
+        if slot != seq % self.frames.slots or not self.frames.valid(seq):
+            raise RuntimeError("Frame was overwritten before inference started")
+
+        height, width = frame.shape[:2]
+        self.request_id += 1
+        self.requests.put((self.name, self.request_id, seq, y, x, height, width))
+
+        # Drop results of requests that already timed out
+        deadline = time.monotonic() + result_timeout
+        while True:
+            request_id, detections = self.results.get(timeout=max(0.0, deadline - time.monotonic()))
+            if request_id != self.request_id:
+                continue
+            if detections is None:
+                raise RuntimeError("Frame was overwritten or inference failed")
+            return detections
+
+
+def plan_slots(fps, latency):
+    # A worker copies a frame at most `latency` seconds after the camera
+    # queued it; the slots must outlast that, plus the slot being written
+    # and the one the camera holds
+    return max(3, math.ceil(fps * latency) + 2)
+
+
+def serve_requests(detector, frames, requests, results, max_batch, batch_window):
+    stopping = False
+    while not stopping:
+        request = requests.get()
+        if request is None:
+            break
+
+        # Gather whatever other cameras queue within the batch window
+        batch = [request]
+        deadline = time.monotonic() + batch_window
+        while len(batch) < max_batch:
+            try:
+                request = requests.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if request is None:
+                stopping = True
+                break
+            batch.append(request)
+
+        # The pixels only have to hold still until they are copied: a copy
+        # the camera overwrote meanwhile is answered with None, the rest
+        # can take as long in the model as they need
+        live, copies = [], []
+        for name, request_id, seq, y, x, height, width in batch:
+            copy = numpy.array(frames[name].view(seq, y, x, height, width))
+            if frames[name].valid(seq):
+                live.append((name, request_id))
+                copies.append(copy)
+            else:
+                results[name].put((request_id, None))
+
+        try:
+            detections = detector.detect_batch(copies) if copies else []
+
+        except Exception:
+            # Answered at once so the cameras skip the frame instead of
+            # waiting out result_timeout
+            log.exception("Batched Inference Failed")
+            detections = [None] * len(live)
+
+        for (name, request_id), result in zip(live, detections):
+            results[name].put((request_id, result))
+
+
+def run_worker(model, buffers, requests, results, names_queue, max_batch, batch_window, cpus):
+    pin(cpus)
+    detector = create_detector(model["backend"], model["path"], model.get("imgsz", 640), model.get("threads", 0))
+    if names_queue is not None:
+        names_queue.put(detector.names)
+
+    frames = {name: SharedFrameBuffer(shape, slots, shm_name) for name, (shm_name, shape, slots) in buffers.items()}
+    serve_requests(detector, frames, requests, results, max_batch, batch_window)
+
+
+def run_camera(config, names, buffer, requests, results, cpus):
+    pin(cpus)
+    name = config["name"]
+    main.headless = True
+    main.frame_width = config.get("width", main.frame_width)
+    main.frame_height = config.get("height", main.frame_height)
+
+    database.spool_path = f"../firestore_spool_{name}.db"
+    database.init()
+    traffic.init(config["serial_port"])
+    traffic.controller_name = config.get("controller", traffic.controller_name)
+    if "location" in config:
+        traffic.lat, traffic.lng = accident.lat, accident.lng = config["location"]
+    hospital.hospitals_file = config.get("hospitals", hospital.hospitals_file)
+    hospital.road_graph_file = config.get("roads", hospital.road_graph_file)
+
+    shm_name, shape, slots = buffer
+    fixed = {"regions": config["regions"]} if config.get("regions") else None
+    registry = IntersectionRegistry(config.get("intersection"), shape, config=fixed)
+    registry.watch()
+    regions = registry.get().regions
+    shared_data = StateStore(initial_state(regions))
+
+    recorder = ClipRecorder(config.get("clips", f"../accident_clips/{name}"), shape)
+    detection_log = main.open_detection_log(os.path.join(config["detection_log"], name), names, shape) if config.get("detection_log") else None
+
+    threading.Thread(target=traffic.run, args=(shared_data, registry), daemon=True).start()
+    threading.Thread(target=accident.run, args=(shared_data, recorder), daemon=True).start()
+    threading.Thread(target=density.run, args=(shared_data, registry), daemon=True).start()
+    threading.Thread(target=webserver.run, args=("0.0.0.0", config.get("ws_port", 8765), shared_data), daemon=True).start()
+
+    frames = SharedFrameBuffer(shape, slots, shm_name)
+    frame_slot = camera.LatestFrame()
+    detector = RemoteDetector(name, frames, frame_slot, names, requests, results)
+    if config.get("roi"):
+        detector = RoiDetector(detector, regions, shape)
+
+    capture = camera.open_capture(config.get("source", 0), main.frame_width, main.frame_height)
+    cap_thread = threading.Thread(target=camera.run, args=(capture, frame_slot, frames), daemon=True)
+    cap_thread.start()
+    log.info(f"Camera {name} Started")
+
+    try:
+        main.run_pipeline(frame_slot, detector, registry, shared_data, recorder=recorder, detection_log=detection_log)
+
+    except KeyboardInterrupt:
+        pass
+
+    except Exception:
+        log.exception(f"Camera {name} Failed")
+
+    finally:
+        frame_slot.close()
+        cap_thread.join(timeout=2)
+        capture.release()
+        recorder.close()
+        if detection_log is not None:
+            detection_log.close()
+        frames.close()
+        traffic.close_arduino()
+        database.close()
+        log.info(f"Camera {name} Stopped")
+
+
+def supervise(config):
+    cameras = config["cameras"]
+    model = config["model"]
+    workers = config.get("workers", 1)
+    max_batch = config.get("max_batch", len(cameras))
+    batch_window = config.get("batch_window_ms", 5) / 1000
+    latency = config.get("max_latency_ms", max_latency_ms) / 1000
+
+    requests = multiprocessing.Queue()
+    names_queue = multiprocessing.Queue()
+    results = {cam["name"]: multiprocessing.Queue() for cam in cameras}
+    frames = {}
+    buffers = {}
+    for cam in cameras:
+        shape = (cam.get("height", main.frame_height), cam.get("width", main.frame_width), 3)
+        slots = plan_slots(cam.get("fps", camera_fps), latency)
+        frames[cam["name"]] = SharedFrameBuffer(shape, slots)
+        buffers[cam["name"]] = (frames[cam["name"]].name, shape, slots)
+
+    camera_cores, worker_cores = plan_cores(len(cameras), workers)
+    processes = []
+
+    try:
+        for i in range(workers):
+            worker = multiprocessing.Process(
+                target=run_worker, name=f"inference-{i}",
+                args=(model, buffers, requests, results, names_queue if i == 0 else None, max_batch, batch_window, worker_cores)
+            )
+            worker.start()
+            processes.append(worker)
+
+        names = names_queue.get(timeout=300)
+        log.info(f"{workers} Inference Worker(s) Ready")
+
+        for cam, cpus in zip(cameras, camera_cores):
+            process = multiprocessing.Process(
+                target=run_camera, name=f"camera-{cam['name']}",
+                args=(cam, names, buffers[cam["name"]], requests, results[cam["name"]], cpus)
+            )
+            process.start()
+            processes.append(process)
+
+        for process in processes[workers:]:
+            process.join()
+
+    except KeyboardInterrupt:
+        log.critical("User Commanded Immediate Shut Down")
+
+    finally:
+        # Cameras got the same interrupt and clean up themselves
+        for process in processes[workers:]:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for _ in range(workers):
+            requests.put(None)
+        for process in processes[:workers]:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        for buffer in frames.values():
+            buffer.close()
+        log.info("Safely Shutting Down...")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TraffIQ multi-camera supervisor")
+    parser.add_argument("--config", default=config_path, help="camera and model configuration (JSON)")
+    args = parser.parse_args()
+
+    with open(args.config) as file:
+        supervise(json.load(file))
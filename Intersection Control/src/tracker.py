@@ -0,0 +1,183 @@
+"""
+================================================================================
+Project: Smart Traffic and Accident Monitoring System
+File: tracker.py
+Author(s): Aashrith Srinivasa.
+License: See LICENSE file in the repository for full terms.
+Description:
+    Multi-object tracker for vehicles, in the style of SORT / ByteTrack but
+    numpy only. Tracks keep stable ids across frames: predicted boxes are
+    matched to confident detections by IoU first, then the tracks left over
+    get a second chance against low-confidence ones. Track state lives in
+    fixed-size arrays, so an update is a handful of vectorized operations.
+
+    From the confirmed tracks it derives, per region, the vehicle count,
+    queue length (tracks slower than `stop_speed`), arrivals and departures
+    per second (exponentially averaged over `rate_window` seconds) and the
+    average wait of the vehicles currently in the region.
+================================================================================
+"""
+
+
+import math
+
+import numpy
+
+import metrics
+
+
+tracks_overflow = metrics.Counter("traffiq_tracks_overflow_total", "Detections not tracked because every track slot was in use")
+
+
+def empty_flow(region_names):
+    return {region: {"queue": 0, "arrivals": 0.0, "departures": 0.0, "wait": 0.0} for region in region_names}
+
+
+def iou_matrix(a, b):
+    x1 = numpy.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = numpy.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = numpy.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = numpy.minimum(a[:, None, 3], b[None, :, 3])
+    inter = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-6)
+
+
+def greedy_match(ious, threshold):
+    # Highest IoU pairs first, each track and detection used once
+    rows, cols = numpy.nonzero(ious >= threshold)
+    order = numpy.argsort(-ious[rows, cols], kind="stable")
+    used_rows, used_cols, pairs = set(), set(), []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            pairs.append((row, col))
+    return pairs
+
+
+class Tracker:
+    def __init__(self, region_mask, region_names, class_id, capacity=256, high_conf=0.5, iou_threshold=0.3,
+                 max_age=1.0, min_hits=3, stop_speed=15.0, rate_window=60.0):
+        # region_mask: frame-sized label image from intersection.create_region_mask
+        self.mask = region_mask
+        self.region_names = region_names
+        self.class_id = class_id
+        self.high_conf = high_conf
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.stop_speed = stop_speed
+        self.rate_window = rate_window
+
+        self.boxes = numpy.zeros((capacity, 4), dtype=numpy.float32)
+        self.velocity = numpy.zeros((capacity, 2), dtype=numpy.float32)  # box centre, px/s
+        self.ids = numpy.zeros(capacity, dtype=numpy.int64)
+        self.hits = numpy.zeros(capacity, dtype=numpy.int32)
+        self.last_seen = numpy.zeros(capacity)
+        self.entered = numpy.zeros(capacity)  # when the track entered its current region
+        self.region = numpy.zeros(capacity, dtype=numpy.intp)  # mask label, 0 = none yet
+        self.alive = numpy.zeros(capacity, dtype=bool)
+        self.next_id = 1
+
+        self.arrivals = numpy.zeros(len(region_names))
+        self.departures = numpy.zeros(len(region_names))
+        self.last_time = None
+
+    def labels_at(self, boxes):
+        height, width = self.mask.shape
+        cx = ((boxes[:, 0] + boxes[:, 2]) / 2).astype(numpy.intp).clip(0, width - 1)
+        cy = ((boxes[:, 1] + boxes[:, 3]) / 2).astype(numpy.intp).clip(0, height - 1)
+        return self.mask[cy, cx].astype(numpy.intp)
+
+    def update(self, detections, now):
+        # Returns (region vehicle counts, per-region flow) after this frame
+        dt = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+
+        is_vehicle = detections.classes.astype(numpy.intp) == self.class_id
+        boxes, confs = detections.boxes[is_vehicle], detections.confs[is_vehicle]
+
+        active = numpy.flatnonzero(self.alive)
+        age = now - self.last_seen[active]
+        predicted = self.boxes[active] + numpy.tile(self.velocity[active] * age[:, None], 2)
+
+        # ByteTrack: confident detections first, then low ones for the rest
+        high = numpy.flatnonzero(confs >= self.high_conf)
+        low = numpy.flatnonzero(confs < self.high_conf)
+        first = greedy_match(iou_matrix(predicted, boxes[high]), self.iou_threshold)
+        unmatched = numpy.ones(len(active), dtype=bool)
+        unmatched[[t for t, _ in first]] = False
+        left = numpy.flatnonzero(unmatched)
+        second = greedy_match(iou_matrix(predicted[left], boxes[low]), self.iou_threshold)
+        pairs = [(active[t], high[d]) for t, d in first] + [(active[left[t]], low[d]) for t, d in second]
+
+        if pairs:
+            tracks, chosen = (numpy.array(column, dtype=numpy.intp) for column in zip(*pairs))
+            elapsed = numpy.maximum(now - self.last_seen[tracks], 1e-3)[:, None]
+            old_centres = (self.boxes[tracks, :2] + self.boxes[tracks, 2:]) / 2
+            new_centres = (boxes[chosen, :2] + boxes[chosen, 2:]) / 2
+            self.velocity[tracks] = 0.6 * self.velocity[tracks] + 0.4 * (new_centres - old_centres) / elapsed
+            self.boxes[tracks] = boxes[chosen]
+            self.hits[tracks] += 1
+            self.last_seen[tracks] = now
+
+        # Unmatched confident detections start new tracks
+        matched = {d for _, d in pairs}
+        fresh = [d for d in high.tolist() if d not in matched]
+        slots = numpy.flatnonzero(~self.alive)[:len(fresh)]
+        if len(slots) < len(fresh):
+            tracks_overflow.inc(len(fresh) - len(slots))
+        fresh = fresh[:len(slots)]
+        self.boxes[slots] = boxes[fresh]
+        self.velocity[slots] = 0
+        self.ids[slots] = numpy.arange(self.next_id, self.next_id + len(slots))
+        self.next_id += len(slots)
+        self.hits[slots] = 1
+        self.last_seen[slots] = now
+        self.region[slots] = 0
+        self.alive[slots] = True
+
+        # Tracks not seen for max_age leave whatever region they were in
+        expired = self.alive & (now - self.last_seen > self.max_age)
+        left_labels = self.region[expired]
+        self.alive[expired] = False
+        self.region[expired] = 0
+
+        # Confirmed tracks moving between regions are departures and arrivals
+        confirmed = numpy.flatnonzero(self.alive & (self.hits >= self.min_hits))
+        labels = self.labels_at(self.boxes[confirmed])
+        moved = labels != self.region[confirmed]
+        count = len(self.region_names) + 1
+        departed = numpy.bincount(numpy.concatenate([left_labels, self.region[confirmed][moved]]), minlength=count)[1:]
+        arrived = numpy.bincount(labels[moved], minlength=count)[1:]
+        self.region[confirmed[moved]] = labels[moved]
+        self.entered[confirmed[moved]] = now
+
+        decay = math.exp(-dt / self.rate_window)
+        self.arrivals = self.arrivals * decay + arrived / self.rate_window
+        self.departures = self.departures * decay + departed / self.rate_window
+
+        return self.summary(confirmed, labels, now)
+
+    def summary(self, confirmed, labels, now):
+        count = len(self.region_names) + 1
+        speed = numpy.hypot(*self.velocity[confirmed].T)
+        vehicles = numpy.bincount(labels, minlength=count)[1:]
+        queued = numpy.bincount(labels[speed < self.stop_speed], minlength=count)[1:]
+        waited = numpy.bincount(labels, weights=now - self.entered[confirmed], minlength=count)[1:]
+        wait = waited / numpy.maximum(vehicles, 1)
+
+        region_counts = dict(zip(self.region_names, vehicles.tolist()))
+        flow = {
+            region: {
+                "queue": int(queued[i]),
+                "arrivals": round(float(self.arrivals[i]), 2),
+                "departures": round(float(self.departures[i]), 2),
+                "wait": round(float(wait[i]), 1)
+            }
+            for i, region in enumerate(self.region_names)
+        }
+        return region_counts, flow
@@ -5,28 +5,35 @@ File: traffic.py
 Author(s): Aashrith Srinivasa.
 License: See LICENSE file in the repository for full terms.
 Description:
-    Handles traffic light control, vehicle counting per region, and
-    logging traffic density data to Firestore at regular intervals.
+    Handles traffic light control for the regions of the intersection.
+    Green times and phase order come from a controller in controller.py,
+    the signal unit of each region from the intersection config; traffic
+    density history is rolled up by density.py.
+
+    The current phase and when it ends are published to `signal_state`
+    for the telemetry channel in webserver.py.
 ================================================================================
 """
 
 
 import time
-import datetime
 import logging as log
 from sys import exit
 
 import serial
-from firebase_admin.firestore import GeoPoint, SERVER_TIMESTAMP
 
-import database
+from serial_link import SignalLink
+from state import StateStore
+from controller import create_controller
+from intersection import IntersectionRegistry
 
 
-tick = 0.1
 arduino = None
-log_interval = 1800
+controller_name = "fixed"
 lat, lng = 12.312735, 76.583278
 
+signal_state = StateStore({"green": None, "next": None, "phase": None, "ends": 0.0, "config": 0})
+
 PHASE_FLOW = {
     "green": "yellow_stop",
     "yellow_stop": "yellow_start",
@@ -34,108 +41,154 @@ PHASE_FLOW = {
 }
 
 
-def init():
+def init(port="COM6"):
     global arduino
     try:
-        arduino = serial.Serial(port="COM6", baudrate=9600, timeout=1)
+        arduino = SignalLink(port=port, baudrate=9600)
 
     except serial.SerialException as e:
         log.critical(f"Arduino connection failed: {e}")
         exit(2)
 
 
-def send_signal(cmd: str):
-    try:
-        arduino.write((cmd + "\n").encode())
-        time.sleep(0.05)
+def set_signals(changes: dict):
+    # changes: {signal: (red, yellow, green)}, sent as one frame
+    arduino.set_signals(changes)
 
-    except serial.SerialException as e:
-        log.error(f"Arduino write failed: {e}")
+    for signal, (red, yellow, green) in changes.items():
+        log.info(f"{signal} → {'R' if red else ''}{'Y' if yellow else ''}{'G' if green else ''}")
 
 
 def set_signal_state(signal: str, red: bool, yellow: bool, green: bool):
-    send_signal(f"{signal}_R_{'ON' if red else 'OFF'}")
-    send_signal(f"{signal}_Y_{'ON' if yellow else 'OFF'}")
-    send_signal(f"{signal}_G_{'ON' if green else 'OFF'}")
-
-    log.info(f"{signal} → {'R' if red else ''}{'Y' if yellow else ''}{'G' if green else ''}")
+    set_signals({signal: (red, yellow, green)})
 
 
 def close_arduino():
-    send_signal("EXIT")
+    if arduino is None:
+        return
+
     arduino.close()
     log.info("Arduino Connection Closed.")
 
 
-def get_durations(vehicle_counts):
-    base = {"yellow_stop": 2, "yellow_start": 2}
-    for region, count in vehicle_counts.items():
-        base[f"green_{region}"] = 9 if count > 1 else 4
-    return base
+def default_controller(intersection):
+    return create_controller(controller_name, intersection.phase_order, intersection.timing)
 
 
-def run(shared_data : dict, lock):
-    regions = database.get_intersection_data()
-    region_names = list(regions.keys())
-    signal_order = {region_names[i]: region_names[(i + 1) % len(region_names)] for i in range(len(region_names))}
+def retire(old, new):
+    # Signal units a reloaded config no longer uses are left at red
+    units = set(old.signals.values()) - set(new.signals.values())
+    if units:
+        set_signals({unit: (True, False, False) for unit in units})
 
-    current_green = region_names[0]
-    next_green = signal_order[current_green]
-    current_phase = "green"
-    last_switch_time = time.time()
-    last_log_time = time.time()
 
-    set_signal_state(current_green, red=False, yellow=False, green=True)
+def run(shared_data : StateStore, registry=None, make_controller=None, clock=time):
+    # `make_controller(intersection)` builds the controller for a config.
+    # `clock` provides time() and sleep(); replay.py runs this loop on the
+    # detection log's time instead of the wall clock.
+    registry = registry or IntersectionRegistry()
+    make_controller = make_controller or default_controller
+    intersection = registry.get()
+    controller = make_controller(intersection)
 
-    durations = get_durations(shared_data.get("vehicle", {}))
-    phase_durations = {
-        "green": durations.get(f"green_{current_green}", 4),
-        "yellow_stop": durations["yellow_stop"],
-        "yellow_start": durations["yellow_start"]
-    }
+    rejected = None
 
+    def reload(latest):
+        # A config the controller cannot be built for is not applied; the
+        # signals keep running on the current one
+        nonlocal rejected
+        try:
+            return latest, make_controller(latest)
 
-    while True:
-        time.sleep(tick)
-        current_time = time.time()
-        elapsed_time = current_time - last_switch_time
+        except Exception:
+            if latest is not rejected:
+                log.exception(f"Could Not Apply Intersection Config v{latest.version}")
+                rejected = latest
+            return intersection, controller
+
+    def switch(changes):
+        # changes: {region: (red, yellow, green)}
+        set_signals({intersection.signals[region]: state for region, state in changes.items()})
 
-        if elapsed_time >= phase_durations[current_phase]:
-            with lock:
-                data = shared_data.copy()
+    current_green = intersection.phase_order[0]
+    next_green = current_green
+    current_phase = "green"
+    last_switch_time = green_start = clock.time()
 
-            durations = get_durations(data.get("vehicle", {}))
+    switch({
+        region: (region != current_green, False, region == current_green)
+        for region in intersection.region_names
+    })
 
-        phase_durations = {
-            "green": durations.get(f"green_{current_green}", 4),
-            "yellow_stop": durations["yellow_stop"],
-            "yellow_start": durations["yellow_start"]
-        }
+    _, data = shared_data.get()
+    phase_duration = controller.green_time(current_green, data)
 
-        if elapsed_time >= phase_durations[current_phase]:
-            if current_phase == "green":
-                set_signal_state(current_green, red=False, yellow=True, green=False)
+    def announce():
+        # `ends` is wall-clock time, so it only changes when the phase does
+        signal_state.publish({
+            "green": current_green,
+            "next": next_green,
+            "phase": current_phase,
+            "ends": round(last_switch_time + phase_duration, 2),
+            "config": intersection.version
+        })
 
-            elif current_phase == "yellow_stop":
-                set_signal_state(current_green, red=True, yellow=False, green=False)
-                set_signal_state(next_green, red=False, yellow=True, green=False)
+    announce()
 
-            elif current_phase == "yellow_start":
-                set_signal_state(next_green, red=False, yellow=False, green=True)
-                current_green = next_green
-                next_green = signal_order[current_green]
+    while True:
+        # Sleep straight through to the next phase switch
+        clock.sleep(max(0.0, last_switch_time + phase_duration - clock.time()))
+        current_time = clock.time()
+        _, data = shared_data.get()
+
+        if current_phase == "green":
+            elapsed = current_time - green_start
+            latest = registry.get()
+            if latest is rejected:
+                latest = intersection
+            survives = current_green in latest.phase_order and latest.signals[current_green] == intersection.signals[current_green]
+            if latest is not intersection and survives:
+                # The green approach survives the reload, so it applies right away
+                old = intersection
+                intersection, controller = reload(latest)
+                retire(old, intersection)
+                latest = intersection
+
+            # Otherwise the old green clears through yellow first and the
+            # new config takes over at yellow_stop
+            next_green = controller.next_green(current_green, data, elapsed) if latest is intersection else None
+
+            if next_green == current_green:
+                # Extended: stays green without a yellow cycle
+                phase_duration = controller.green_time(current_green, data, elapsed)
+            else:
+                switch({current_green: (False, True, False)})
+                current_phase = PHASE_FLOW[current_phase]
+                phase_duration = intersection.yellow_time
+
+        elif current_phase == "yellow_stop":
+            cleared = {intersection.signals[current_green]: (True, False, False)}
+            if next_green is None:
+                old = intersection
+                intersection, controller = reload(registry.get())
+                if intersection is old:
+                    order = old.phase_order
+                    next_green = order[(order.index(current_green) + 1) % len(order)] if current_green in order else order[0]
+                else:
+                    retire(old, intersection)
+                    next_green = intersection.phase_order[0]
+                    log.info(f"Signals Switched to Intersection Config v{intersection.version}")
+
+            set_signals({**cleared, intersection.signals[next_green]: (False, True, False)})
+            current_phase = PHASE_FLOW[current_phase]
+            phase_duration = intersection.yellow_time
 
+        elif current_phase == "yellow_start":
+            switch({next_green: (False, False, True)})
+            current_green = next_green
+            green_start = current_time
             current_phase = PHASE_FLOW[current_phase]
-            last_switch_time = current_time
-
-        if current_time - last_log_time >= log_interval:
-            data_pack = {
-                "time": SERVER_TIMESTAMP,
-                "location" : GeoPoint(lat, lng),
-                "density" : data["total"]
-            }
-
-            document_id = datetime.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            database.write_data(collection="traffic_data", data=data_pack, document_id=document_id)
-            last_log_time = current_time
-            log.info("Auto-Logged Traffic Density Data")
+            phase_duration = controller.green_time(current_green, data)
+
+        last_switch_time = current_time
+        announce()
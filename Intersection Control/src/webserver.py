@@ -6,28 +6,362 @@ Author(s): Aashrith Srinivasa.
 License: See LICENSE file in the repository for full terms.
 Description:
     WebSocket server for the traffic and accident monitoring system. 
-    Streams raw camera frames to the frontend and handles 
-    start/stop control messages.
+    Encodes each new camera frame once per stream level and hands it to
+    every subscribed client through a bounded, stale-dropping queue. Each
+    client's resolution, JPEG quality and frame rate adapt to its measured
+    send latency. Handles start/stop control messages per client, where
+    "start_video" may carry optional "max_width" and "max_fps" caps.
+    Plain HTTP GET /metrics on the same port returns the controller's
+    metrics in the Prometheus text format.
+
+    "start_telemetry" subscribes a client to the live state instead: region
+    counts, accident flags and the signal phase, flattened to dotted keys.
+    It gets a full snapshot first and then only deltas, each with a version
+    and the version it applies on top of (`base`). Changes are coalesced to
+    at most `telemetry_rate` messages per second, or the client's optional
+    "max_rate". `signal.ends` is the server time the phase ends at;
+    `signal.remaining` comes with every message that changes the phase.
+        {"type": "telemetry_snapshot", "version": 12, "time": ..., "state": {...}}
+        {"type": "telemetry", "version": 15, "base": 12, "time": ...,
+         "changes": {"vehicle.A": 3, "total": 5}, "removed": []}
 ================================================================================
 """
 
 
 import json
-import base64
+import time
+import struct
 import asyncio
+import threading
 import logging as log
+from http import HTTPStatus
 
 import cv2
 import websockets
 
+import metrics
+import traffic
+
+
+latest = (0, None)
+subscribers = {}
+telemetry_subscribers = {}
+loop = None
+frame_ready = None
+state_ready = None
+shared_state = None
+
+# Stream levels from best to worst: (scale, JPEG quality, max FPS).
+# Each client moves along this ladder based on how fast its sends complete.
+STREAM_LEVELS = [
+    (1.0, 80, 20),
+    (0.75, 70, 15),
+    (0.5, 60, 10),
+    (0.35, 50, 5)
+]
+queue_size = 2
+slow_send = 0.15
+fast_send = 0.03
+upgrade_after = 30
+telemetry_rate = 10
+telemetry_queue_size = 4
+
+encode_time = metrics.stage("jpeg_encode")
+client_drops = metrics.Counter("traffiq_stream_frames_dropped_total", "Frames dropped from slow clients' send queues")
+metrics.Gauge("traffiq_stream_subscribers", "Clients subscribed to the video stream", fn=lambda: len(subscribers))
+metrics.Gauge("traffiq_telemetry_subscribers", "Clients subscribed to telemetry", fn=lambda: len(telemetry_subscribers))
+telemetry_resyncs = metrics.Counter("traffiq_telemetry_resyncs_total", "Telemetry snapshots resent to clients that fell behind")
+
+
+class Client:
+    def __init__(self, websocket, max_width=None, max_fps=None):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.max_fps = max_fps
+        self.min_level = 0
+        self.level = 0
+        self.max_width = max_width
+        self.last_queued = 0.0
+        self.send_latency = 0.0
+        self.fast_sends = 0
+        self.dropped = 0
+        self.sender = loop.create_task(self.send_loop())
+
+    def fit_width(self, frame_width):
+        # Best level whose output width respects the client's requested cap
+        if self.max_width is None:
+            return
+
+        self.min_level = len(STREAM_LEVELS) - 1
+        for i, (scale, _, _) in enumerate(STREAM_LEVELS):
+            if frame_width * scale <= self.max_width:
+                self.min_level = i
+                break
+
+        self.level = max(self.level, self.min_level)
+        self.max_width = None
+
+    def interval(self):
+        fps = STREAM_LEVELS[self.level][2]
+        if self.max_fps:
+            fps = min(fps, self.max_fps)
+        return 1 / fps
+
+    def due(self, now):
+        return now - self.last_queued >= self.interval()
+
+    def offer(self, message, now):
+        # Bounded queue: a slow client loses its oldest frame, never blocks others
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            client_drops.inc()
+            self.degrade()
+
+        self.queue.put_nowait(message)
+        self.last_queued = now
+
+    def degrade(self):
+        self.level = min(self.level + 1, len(STREAM_LEVELS) - 1)
+        self.fast_sends = 0
+
+    def adapt(self, latency):
+        self.send_latency = 0.8 * self.send_latency + 0.2 * latency
+
+        if self.send_latency > slow_send:
+            self.degrade()
+            self.send_latency = 0.0
+
+        elif self.send_latency < fast_send:
+            self.fast_sends += 1
+            if self.fast_sends >= upgrade_after and self.level > self.min_level:
+                self.level -= 1
+                self.fast_sends = 0
+
+    async def send_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                start = loop.time()
+                await self.websocket.send(message)
+                self.adapt(loop.time() - start)
+
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def close(self):
+        self.sender.cancel()
+
+
+class TelemetryClient:
+    def __init__(self, websocket, max_rate=None):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=telemetry_queue_size)
+        self.interval = 1 / min(max_rate or telemetry_rate, telemetry_rate)
+        self.state = None  # what this client has been sent, None until the snapshot
+        self.version = 0
+        self.last_sent = float("-inf")
+        self.sender = loop.create_task(self.send_loop())
+
+    def update(self, state, version, now):
+        # Returns the seconds until the client is due when it has changes
+        # waiting, so the broadcaster can wake up for them
+        if self.state is not None and version == self.version:
+            return None
+
+        wait = self.last_sent + self.interval - now
+        if wait > 0:
+            return wait
+
+        if self.queue.full():
+            # Fell behind: the deltas queued so far are replaced by a snapshot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.state = None
+            telemetry_resyncs.inc()
+
+        if self.state is None:
+            message = {"type": "telemetry_snapshot", "version": version, "state": with_remaining(state, state)}
+        else:
+            changes = {key: value for key, value in state.items() if key not in self.state or self.state[key] != value}
+            removed = [key for key in self.state if key not in state]
+            message = {"type": "telemetry", "version": version, "base": self.version,
+                       "changes": with_remaining(changes, state), "removed": removed}
+
+        message["time"] = round(time.time(), 3)
+        self.queue.put_nowait(json.dumps(message, separators=(",", ":")))
+        self.state, self.version, self.last_sent = state, version, now
+        return None
+
+    async def send_loop(self):
+        try:
+            while True:
+                await self.websocket.send(await self.queue.get())
+
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def close(self):
+        self.sender.cancel()
+
+
+def flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        if hasattr(value, "items"):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = round(value, 2) if isinstance(value, float) else value
+    return flat
+
+
+def telemetry_state():
+    _, data = shared_state.get()
+    _, signal = traffic.signal_state.get()
+    return flatten({
+        "vehicle": data["vehicle"],
+        "total": data["total"],
+        "accident": data["accident"],
+        "signal": signal
+    })
+
+
+def with_remaining(changes, state):
+    if not any(key.startswith("signal.") for key in changes):
+        return changes
+    return {**changes, "signal.remaining": round(max(0.0, state["signal.ends"] - time.time()), 2)}
+
+
+def has_subscribers():
+    return bool(subscribers)
+
+
+def publish_frame(frame):
+    # Called from the capture/inference thread. Wakes the broadcaster,
+    # which encodes the frame once per stream level in use.
+    global latest
+    latest = (latest[0] + 1, frame)
 
-streaming_enabled = False
-latest_frame = None
-frame_interval = 0.05
+    if loop is not None and subscribers:
+        loop.call_soon_threadsafe(frame_ready.set)
+
+
+def encode_frame(seq, frame, scale, quality):
+    # Binary message: 4 byte big-endian sequence number followed by the JPEG.
+    with encode_time.time():
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return struct.pack(">I", seq & 0xFFFFFFFF) + buffer.tobytes()
+
+
+async def broadcast():
+    last_seq = 0
+
+    while True:
+        await frame_ready.wait()
+        frame_ready.clear()
+
+        seq, frame = latest
+        if frame is None or seq == last_seq or not subscribers:
+            continue
+
+        last_seq = seq
+        now = loop.time()
+        by_level = {}
+        for client in list(subscribers.values()):
+            # One misbehaving client must not end the broadcaster
+            try:
+                client.fit_width(frame.shape[1])
+                if client.due(now):
+                    by_level.setdefault(client.level, []).append(client)
+
+            except Exception:
+                log.exception("Dropping Stream Client")
+                unsubscribe(client.websocket)
+
+        for level, clients in by_level.items():
+            scale, quality, _ = STREAM_LEVELS[level]
+            try:
+                message = await loop.run_in_executor(None, encode_frame, seq, frame, scale, quality)
+
+            except Exception:
+                log.exception("Frame Encoding Failed")
+                continue
+
+            for client in clients:
+                client.offer(message, now)
+
+
+def watch_state(store):
+    # Blocks on the store's condition in its own thread and wakes the
+    # telemetry broadcaster on the event loop
+    version = 0
+    while True:
+        version, _ = store.wait(version)
+        if loop is not None and telemetry_subscribers:
+            loop.call_soon_threadsafe(state_ready.set)
+
+
+async def broadcast_telemetry():
+    state, version = None, 0
+    timeout = None
+
+    while True:
+        try:
+            await asyncio.wait_for(state_ready.wait(), timeout)
+
+        except asyncio.TimeoutError:
+            pass
+
+        state_ready.clear()
+        timeout = None
+        if not telemetry_subscribers:
+            continue
+
+        current = telemetry_state()
+        if current != state:
+            state, version = current, version + 1
+
+        now = loop.time()
+        waits = [client.update(state, version, now) for client in list(telemetry_subscribers.values())]
+        waits = [wait for wait in waits if wait is not None]
+        if waits:
+            timeout = min(waits)
+
+
+def positive(value):
+    # Client supplied caps: a positive number, anything else is ignored
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+        return None
+    return value
+
+
+def subscribe(websocket, data):
+    unsubscribe(websocket)
+    subscribers[websocket] = Client(websocket, positive(data.get("max_width")), positive(data.get("max_fps")))
+
+
+def unsubscribe(websocket):
+    client = subscribers.pop(websocket, None)
+    if client is not None:
+        client.close()
+
+
+def subscribe_telemetry(websocket, data):
+    unsubscribe_telemetry(websocket)
+    telemetry_subscribers[websocket] = TelemetryClient(websocket, positive(data.get("max_rate")))
+    state_ready.set()
+
+
+def unsubscribe_telemetry(websocket):
+    client = telemetry_subscribers.pop(websocket, None)
+    if client is not None:
+        client.close()
 
 
 async def vhandler(websocket):
-    global streaming_enabled, latest_frame
     log.info("Websocket Client Connected")
 
     try:
@@ -36,25 +370,25 @@ async def vhandler(websocket):
             msg_type = data.get("type")
 
             if msg_type == "start_video":
-                streaming_enabled = True
+                subscribe(websocket, data)
                 log.info("Streaming Started to Client")
-
                 await websocket.send(json.dumps({"status" : "streaming started"}))
 
-                while streaming_enabled and websocket.state == websockets.protocol.State.OPEN:
-                    if latest_frame is not None:
-                        _, buffer = cv2.imencode(".jpg", latest_frame)
-                        frame_b64 = base64.b64encode(buffer).decode("utf-8")
-
-                        await websocket.send(json.dumps({"type": "video_frame", "frame": frame_b64}))
-
-                    await asyncio.sleep(frame_interval)
-
             elif msg_type == "stop_video":
-                streaming_enabled = False
+                unsubscribe(websocket)
                 log.info("Streaming Stopped to Client")
                 await websocket.send(json.dumps({"status": "streaming stopped"}))
 
+            elif msg_type == "start_telemetry" and shared_state is not None:
+                await websocket.send(json.dumps({"status": "telemetry started"}))
+                subscribe_telemetry(websocket, data)
+                log.info("Telemetry Started to Client")
+
+            elif msg_type == "stop_telemetry":
+                unsubscribe_telemetry(websocket)
+                log.info("Telemetry Stopped to Client")
+                await websocket.send(json.dumps({"status": "telemetry stopped"}))
+
     except websockets.exceptions.ConnectionClosed:
         log.error("Websocket Connection Closed")
     
@@ -62,25 +396,47 @@ async def vhandler(websocket):
         log.exception("Unexpected Exception Occured")
 
     finally:
-        streaming_enabled = False
+        unsubscribe(websocket)
+        unsubscribe_telemetry(websocket)
         log.info("Client Disconnected. Stopped Streaming")
 
 
-def run(host, port):
+def process_request(connection, request):
+    # Plain HTTP on the websocket port: /metrics serves the Prometheus text
+    if request.path == "/metrics":
+        return connection.respond(HTTPStatus.OK, metrics.render())
+    return None
+
+
+def run(host, port, shared_data=None):
+    # Telemetry is only offered when given the detection state to report
+    global loop, frame_ready, state_ready, shared_state
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
     async def start():
-        server = await websockets.serve(vhandler, host, port)
+        server = await websockets.serve(vhandler, host, port, process_request=process_request)
         log.info("Websocket Started")
         return server
     
+    frame_ready = asyncio.Event()
+    state_ready = asyncio.Event()
     server = loop.run_until_complete(start())
+    broadcaster = loop.create_task(broadcast())
+
+    shared_state = shared_data
+    if shared_data is not None:
+        telemetry = loop.create_task(broadcast_telemetry())
+        for store in (shared_data, traffic.signal_state):
+            threading.Thread(target=watch_state, args=(store,), daemon=True).start()
 
     try:
         loop.run_forever()
 
     finally:
+        broadcaster.cancel()
+        if shared_data is not None:
+            telemetry.cancel()
         server.close()
         loop.run_until_complete(server.wait_closed())
         loop.close()
@@ -0,0 +1,164 @@
+import sqlite3
+
+import google.api_core.exceptions
+import pytest
+
+import database
+from benchmark import MemoryBatch, MemoryFirestore
+
+
+class FlakyBatch(MemoryBatch):
+    def commit(self):
+        # Like Firestore: a batch either applies completely or not at all
+        # `failures` holds one entry per upcoming commit: an error to
+        # raise, or None to let it through
+        failure = self.store.failures.pop(0) if self.store.failures else None
+        if failure is not None:
+            raise failure
+        for key, _, merge in self.ops:
+            if merge and key not in self.store.documents:
+                raise google.api_core.exceptions.NotFound(f"{key} not found")
+        super().commit()
+
+
+class FlakyFirestore(MemoryFirestore):
+    def __init__(self):
+        super().__init__()
+        self.failures = []
+
+    def batch(self):
+        return FlakyBatch(self)
+
+
+@pytest.fixture
+def firestore(monkeypatch):
+    client = FlakyFirestore()
+    monkeypatch.setattr(database, "database", client)
+    return client
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / "spool.db"))
+    connection.execute(
+        "CREATE TABLE spool "
+        "(id INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT, collection TEXT, document_id TEXT, data TEXT)"
+    )
+    yield connection
+    connection.close()
+
+
+def record(op, document_id, data):
+    return (op, "accident_data", document_id, data, 1000.0)
+
+
+def unavailable():
+    return google.api_core.exceptions.ServiceUnavailable("offline")
+
+
+def spooled(connection):
+    return connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+
+def test_flush_spools_when_offline_and_replay_drains(firestore, connection):
+    firestore.failures = [unavailable()]
+    records = [record("set", "a", {"time": database.SERVER_TIMESTAMP, "location": database.GeoPoint(1.0, 2.0)})]
+
+    assert database.flush(connection, records, True) is False
+    assert spooled(connection) == 1
+    assert firestore.documents == {}
+
+    assert database.replay(connection) is True
+    assert spooled(connection) == 0
+    document = firestore.documents[("accident_data", "a")]
+    assert document["location"].latitude == 1.0
+    assert document["time"].timestamp() == 1000.0
+
+
+def test_not_found_update_is_dropped_alone(firestore, connection):
+    records = [
+        record("set", "a", {"n": 1}),
+        record("update", "missing", {"clip": "x"}),
+        record("set", "b", {"n": 2})
+    ]
+
+    assert database.flush(connection, records, True) is True
+    assert set(firestore.documents) == {("accident_data", "a"), ("accident_data", "b")}
+    assert spooled(connection) == 0
+
+
+def test_outage_during_not_found_fallback_spools_the_rest(firestore, connection):
+    records = [
+        record("set", "a", {"n": 1}),
+        record("update", "missing", {"clip": "x"}),
+        record("set", "b", {"n": 2}),
+        record("set", "c", {"n": 3})
+    ]
+
+    # The batch hits NotFound, then Firestore goes away after one record
+    firestore.failures = [None, None, None, unavailable()]
+    assert database.flush(connection, records, True) is False
+
+    assert set(firestore.documents) == {("accident_data", "a")}
+    assert spooled(connection) == 2
+
+    assert database.replay(connection) is True
+    assert set(firestore.documents) == {("accident_data", k) for k in "abc"}
+
+
+def test_replay_keeps_uncommitted_rows_when_fallback_fails(firestore, connection):
+    database.spool(connection, [
+        record("update", "missing", {"clip": "x"}),
+        record("set", "a", {"n": 1}),
+        record("set", "b", {"n": 2})
+    ])
+
+    firestore.failures = [None, None, None, unavailable()]
+    assert database.replay(connection) is False
+
+    assert set(firestore.documents) == {("accident_data", "a")}
+    assert spooled(connection) == 1
+
+    assert database.replay(connection) is True
+    assert set(firestore.documents) == {("accident_data", "a"), ("accident_data", "b")}
+
+
+@pytest.mark.parametrize("error", [
+    google.api_core.exceptions.InvalidArgument("document too large"),
+    google.api_core.exceptions.PermissionDenied("rules"),
+    ValueError("bad field path")
+])
+def test_rejected_write_is_dropped_without_going_offline(firestore, connection, error):
+    records = [record("set", "bad", {"n": 0}), record("set", "a", {"n": 1})]
+
+    # The batch is rejected, then the bad record again on its own
+    firestore.failures = [error, error]
+    assert database.flush(connection, records, True) is True
+    assert set(firestore.documents) == {("accident_data", "a")}
+    assert spooled(connection) == 0
+
+
+def test_rejected_write_at_spool_head_does_not_block_replay(firestore, connection):
+    database.spool(connection, [
+        record("set", "bad", {"n": 0}),
+        record("set", "a", {"n": 1}),
+        record("set", "b", {"n": 2})
+    ])
+
+    rejected = google.api_core.exceptions.InvalidArgument("document too large")
+    firestore.failures = [rejected, rejected]
+    assert database.replay(connection) is True
+    assert set(firestore.documents) == {("accident_data", "a"), ("accident_data", "b")}
+    assert spooled(connection) == 0
+
+
+def test_spool_failure_drops_the_writes_instead_of_raising(firestore, connection):
+    # A value JSON cannot hold, then a spool the database cannot write
+    firestore.failures = [unavailable()]
+    assert database.flush(connection, [record("set", "a", {"n": object()})], True) is False
+
+    connection.execute("DROP TABLE spool")
+    firestore.failures = [unavailable()]
+    assert database.flush(connection, [record("set", "a", {"n": 1})], True) is False
+    assert database.replay(connection) is False
+    assert firestore.documents == {}
@@ -0,0 +1,42 @@
+import pytest
+
+from density import DensityAggregator
+
+
+def run(aggregator, steps, start=600):
+    # steps: [(seconds, counts)]; returns every window closed on the way
+    closed, now = [], start
+    for seconds, counts in steps:
+        closed += aggregator.observe(counts, now)
+        now += seconds
+    return closed + aggregator.observe([0] * len(aggregator.names), now)
+
+
+def test_busy_junction_percentiles():
+    # Far above the initial histogram, as on a busy junction
+    closed = run(DensityAggregator(["A"], resolutions=(60,)), [(60, [40, 120])])
+    (resolution, start, summary), = closed
+    assert (resolution, start) == (60, 600)
+    assert summary["total"] == {
+        "min": 120, "max": 120, "mean": 120.0, "p50": 120, "p90": 120, "vehicle_seconds": 7200.0
+    }
+
+
+def test_time_weighted_percentiles():
+    steps = [(30, [0, 10]), (18, [0, 100]), (12, [0, 300])]
+    (_, _, summary), = run(DensityAggregator(["A"], resolutions=(60,)), steps)
+    total = summary["total"]
+    assert (total["min"], total["max"]) == (10, 300)
+    assert (total["p50"], total["p90"]) == (10, 300)
+    assert total["mean"] == pytest.approx((30 * 10 + 18 * 100 + 12 * 300) / 60, abs=0.01)
+
+
+def test_wide_fine_window_merges_into_coarse():
+    # The 1 min window grows for the busy minute; the 2 min one merges it
+    aggregator = DensityAggregator(["A"], resolutions=(60, 120))
+    closed = run(aggregator, [(60, [1, 2]), (60, [200, 250])], start=0)
+    coarse = [summary for resolution, _, summary in closed if resolution == 120]
+    assert len(coarse) == 1
+    assert coarse[0]["total"]["max"] == 250
+    assert coarse[0]["total"]["p90"] == 250
+    assert coarse[0]["A"]["p50"] == 1
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+
+import pytest
+
+from intersection import IntersectionRegistry
+
+
+REGIONS = {"A": [[0, 0], [0, 10], [10, 10]], "B": [[20, 0], [20, 10], [30, 10]]}
+
+
+@pytest.fixture
+def registry():
+    return IntersectionRegistry(frame_shape=(40, 40, 3), config={"regions": REGIONS})
+
+
+@pytest.mark.parametrize("config", [
+    None,
+    [],
+    {},
+    {"regions": [[0, 0], [1, 1], [2, 0]]},
+    {"regions": REGIONS, "timing": []},
+    {"regions": REGIONS, "signals": []},
+    {"regions": REGIONS, "phase_order": 5},
+    {"regions": {"A": "not points"}}
+])
+def test_malformed_config_is_rejected(registry, config):
+    assert not registry.apply(config)
+    assert registry.get().version == 1
+
+
+def write_config(path, text, step):
+    path.write_text(text)
+    # Poll compares mtimes, which may not tick between quick writes
+    os.utime(path, (time.time() + step, time.time() + step))
+
+
+def wait_for_version(registry, version, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while registry.get().version != version and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return registry.get().version
+
+
+def test_watcher_survives_bad_saves(tmp_path, monkeypatch):
+    path = tmp_path / "intersection.json"
+    path.write_text(json.dumps({"regions": REGIONS}))
+    registry = IntersectionRegistry(str(path), (40, 40, 3), poll_interval=0.01)
+    registry.watch()
+
+    write_config(path, json.dumps({"regions": [[0, 0], [1, 1], [2, 0]]}), 1)
+    write_config(path, "{not json", 2)
+
+    # A failure nothing expects, e.g. from the filesystem layer
+    load = registry.load
+    calls = []
+
+    def failing_load():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("disk went away")
+        return load()
+
+    monkeypatch.setattr(registry, "load", failing_load)
+    write_config(path, json.dumps({"regions": REGIONS, "phase_order": ["B", "A"]}), 3)
+    while not calls:
+        time.sleep(0.01)
+    write_config(path, json.dumps({"regions": REGIONS, "phase_order": ["B", "A"]}), 4)
+
+    assert wait_for_version(registry, 2) == 2
+    assert registry.get().phase_order == ["B", "A"]
+    assert registry.watcher.is_alive()
+
+
+@pytest.mark.parametrize("timing", [
+    {"pressure": {"extension": 0, "max_green": 1e9}, "fixed_time": {"green": 0}},
+    {"pressure": {"extension": -1}},
+    {"pressure": {"min_green": 0}},
+    {"pressure": {"min_green": 20, "max_green": 10}},
+    {"pressure": {"extension": float("nan")}},
+    {"pressure": {"wait_weight": -0.1}},
+    {"fixed_time": {"green": "10"}},
+    {"fixed_time": {"green": True}},
+    {"yellow": 0}
+])
+def test_timing_the_signal_loop_cannot_run_is_rejected(registry, timing):
+    assert not registry.apply({"regions": REGIONS, "timing": timing})
+    assert registry.get().version == 1
+
+
+def test_valid_timing_is_accepted(registry):
+    timing = {"yellow": 3, "pressure": {"min_green": 8, "max_green": 8, "extension": 1.5}, "fixed_time": {"green": 12}}
+    assert registry.apply({"regions": REGIONS, "timing": timing})
+    assert registry.get().timing == timing
@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+
+import pytest
+
+import serial_link
+from serial_link import SignalLink, encode_frame, encode_state
+
+
+class FakeArduino:
+    # The far end of a pseudo terminal: reads frames off the master side
+    # and answers each with the next of `replies` ("ACK", "NAK" or None
+    # for no answer), echoing the frame's sequence number
+    def __init__(self, replies):
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self.replies = list(replies)
+        self.frames = []
+        self.received = threading.Event()
+        self.reader = threading.Thread(target=self.run, daemon=True)
+        self.reader.start()
+
+    def run(self):
+        buffer = b""
+        while True:
+            try:
+                chunk = os.read(self.master, 256)
+            except OSError:
+                return
+            if not chunk:
+                return
+
+            buffer += chunk
+            while b"\n" in buffer:
+                frame, buffer = buffer.split(b"\n", 1)
+                self.frames.append(frame + b"\n")
+                reply = self.replies.pop(0) if self.replies else "ACK"
+                if reply is not None:
+                    os.write(self.master, f"{reply} {frame[1:3].decode()}\n".encode())
+                if not self.replies:
+                    self.received.set()
+
+    def close(self):
+        os.close(self.slave)
+        os.close(self.master)
+
+
+@pytest.fixture
+def arduino(request):
+    device = FakeArduino(getattr(request, "param", []))
+    yield device
+    device.close()
+
+
+def checksum(frame):
+    payload = frame[1:frame.index(b"*")]
+    value = 0
+    for char in payload:
+        value ^= char
+    return value
+
+
+def test_frame_encoding():
+    red, green = encode_state(True, False, False), encode_state(False, False, True)
+    frame = encode_frame(0x1F, {"A": green, "C": red})
+
+    # B has no state, so it is held at red; 0x43 is the XOR of "1F411"
+    assert frame == b"$1F411*43\n"
+    assert int(frame[-3:-1], 16) == checksum(frame)
+
+
+@pytest.mark.parametrize("arduino", [["ACK"]], indirect=True)
+def test_acked_frame(arduino):
+    link = SignalLink(port=arduino.port)
+    try:
+        assert link.send({"A": encode_state(False, False, True)})
+        assert arduino.frames == [encode_frame(1, {"A": 4})]
+        assert (link.acked, link.failed) == (1, 0)
+    finally:
+        link.close()
+
+
+@pytest.mark.parametrize("arduino", [["NAK", "ACK"]], indirect=True)
+def test_nak_then_retry(arduino):
+    link = SignalLink(port=arduino.port)
+    try:
+        assert link.send({"A": 1, "B": 4})
+
+        # The same frame, sequence number included, is sent again
+        assert arduino.frames == [encode_frame(1, {"A": 1, "B": 4})] * 2
+        assert (link.acked, link.failed) == (1, 0)
+    finally:
+        link.close()
+
+
+@pytest.mark.parametrize("arduino", [[None] * serial_link.send_retries], indirect=True)
+def test_gives_up_after_retries(arduino):
+    link = SignalLink(port=arduino.port)
+    try:
+        assert not link.send({"A": 1})
+        assert len(arduino.frames) == serial_link.send_retries
+        assert (link.acked, link.failed) == (0, 1)
+    finally:
+        link.close()
+
+
+@pytest.mark.parametrize("arduino", [["ACK"]], indirect=True)
+def test_writer_survives_a_bad_frame(arduino):
+    link = SignalLink(port=arduino.port)
+    try:
+        # An empty state cannot be encoded; the writer logs it and goes on
+        link.pending.put({})
+        while not link.pending.empty():
+            time.sleep(0.01)
+        link.set_signals({"A": (False, False, True)})
+        assert arduino.received.wait(2)
+        assert link.writer.is_alive()
+        assert arduino.frames[-1][3:4] == b"4"
+    finally:
+        link.close()
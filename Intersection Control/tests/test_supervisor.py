@@ -0,0 +1,86 @@
+import time
+import queue
+import threading
+
+import pytest
+
+import supervisor
+from frame_buffer import SharedFrameBuffer
+
+
+class SlowDetector:
+    # Takes far longer than the buffer lasts at the writer's rate and
+    # reports the pixel value of every frame it was given
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def detect_batch(self, frames):
+        time.sleep(self.seconds)
+        return [int(frame[0, 0, 0]) for frame in frames]
+
+
+@pytest.fixture
+def frames():
+    buffer = SharedFrameBuffer((4, 4, 3), slots=3)
+    yield buffer
+    buffer.close()
+
+
+def write(frames, stop, period):
+    while not stop.is_set():
+        seq, view = frames.begin_write()
+        view[:] = seq % 256
+        frames.end_write(seq)
+        time.sleep(period)
+
+
+def test_slow_detector_lapped_by_fast_writer(frames):
+    requests, results = queue.Queue(), {"north": queue.Queue()}
+    worker = threading.Thread(
+        target=supervisor.serve_requests,
+        args=(SlowDetector(0.3), {"north": frames}, requests, results, 4, 0.005),
+        daemon=True
+    )
+    worker.start()
+
+    stop = threading.Event()
+    writer = threading.Thread(target=write, args=(frames, stop, 0.01), daemon=True)
+    writer.start()
+    try:
+        answers = []
+        for request_id in range(3):
+            seq = frames.latest()
+            requests.put(("north", request_id, seq, 0, 0, 4, 4))
+            answers.append((seq, results["north"].get(timeout=5)))
+
+            # The writer went round the 3 slots many times during inference
+            assert frames.latest() - seq > frames.slots
+
+        # Every frame was copied before it was overwritten, so each result
+        # is for the frame requested
+        assert [result for _, result in answers] == [(i, seq % 256) for i, (seq, _) in enumerate(answers)]
+
+    finally:
+        stop.set()
+        writer.join()
+        requests.put(None)
+        worker.join(timeout=5)
+
+
+def test_overwritten_before_copy(frames):
+    requests, results = queue.Queue(), {"north": queue.Queue()}
+    for _ in range(frames.slots + 1):
+        seq, view = frames.begin_write()
+        frames.end_write(seq)
+
+    requests.put(("north", 7, 1, 0, 0, 4, 4))
+    requests.put(None)
+    supervisor.serve_requests(SlowDetector(0), {"north": frames}, requests, results, 4, 0.005)
+    assert results["north"].get_nowait() == (7, None)
+
+
+def test_plan_slots():
+    # 30 fps and half a second of latency: 15 periods, the slot being
+    # written and the camera's own
+    assert supervisor.plan_slots(30, 0.5) == 17
+    assert supervisor.plan_slots(1, 0.01) == 3
@@ -11,6 +11,7 @@ function AccidentAlert({ accidentData, onDecision }) {
   // WebSocket connection for live video feed
   useEffect(() => {
     const ws = new WebSocket("ws://localhost:8765");
+    ws.binaryType = "arraybuffer";
     wsRef.current = ws;
 
     ws.onopen = () => {
@@ -21,9 +22,12 @@ function AccidentAlert({ accidentData, onDecision }) {
     };
 
     ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      if (data.type === "video_frame" && videoRef.current) {
-        videoRef.current.src = `data:image/jpeg;base64,${data.frame}`;
+      // Binary messages are frames: 4 byte sequence number + JPEG bytes
+      if (event.data instanceof ArrayBuffer && videoRef.current) {
+        const jpeg = new Blob([new Uint8Array(event.data, 4)], { type: "image/jpeg" });
+        const previous = videoRef.current.src;
+        videoRef.current.src = URL.createObjectURL(jpeg);
+        if (previous.startsWith("blob:")) URL.revokeObjectURL(previous);
       }
     };
 
@@ -1,5 +1,5 @@
 import { useEffect, useState } from "react";
-import { collection, onSnapshot } from "firebase/firestore";
+import { collection, query, where, orderBy, limit, onSnapshot, getDocs } from "firebase/firestore";
 import { db } from "./firebase";
 import { LineChart, Line, XAxis, YAxis, Tooltip, CartesianGrid, BarChart, Bar, Legend } from "recharts";
 import { MapContainer, TileLayer, Marker, Popup, useMap } from "react-leaflet";
@@ -17,28 +17,69 @@ function RecenterMap({ lat, lng }) {
     return null;
 }
 
+// Documents shown per resolution
+const historyLimit = 500;
+
 function TrafficDashboard() {
     const [traffic, setTraffic] = useState([]);
     const [hoveredEntry, setHoveredEntry] = useState(null);
     const [selectedEntry, setSelectedEntry] = useState(null);
     const [activeTab, setActiveTab] = useState("line");
+    const [resolution, setResolution] = useState(3600);
 
     useEffect(() => {
-        const unsub = onSnapshot(
+        // Only the newest rollups of the chosen resolution are listened to
+        const rollups = query(
             collection(db, "traffic_data"),
+            where("resolution", "==", resolution),
+            orderBy("time", "desc"),
+            limit(historyLimit)
+        );
+        setTraffic([]);
+        let live = [];
+        let legacy = [];
+        let active = true;
+        const show = () => setTraffic(
+            [...legacy, ...live].sort((a, b) => (a.time?.toMillis?.() ?? 0) - (b.time?.toMillis?.() ?? 0))
+        );
+
+        const unsub = onSnapshot(
+            rollups,
             (snapshot) => {
-                const data = snapshot.docs.map((doc) => ({
+                live = snapshot.docs.map((doc) => ({
                     id: doc.id,
                     ...doc.data(),
                 }));
-                setTraffic(data);
+                show();
             },
             (error) => {
                 console.error("Error fetching traffic data:", error);
             }
         );
-        return () => unsub();
-    }, []);
+
+        // Before rollups, the counts at that instant were written every
+        // 30 min, with no resolution; they predate the rollups, so they are
+        // among the oldest documents, and are shown (labelled as legacy)
+        // with the 1 h view as the nearest match
+        if (resolution === 3600) {
+            getDocs(query(collection(db, "traffic_data"), orderBy("time"), limit(historyLimit)))
+                .then((snapshot) => {
+                    if (!active) return;
+                    legacy = snapshot.docs
+                        .filter((doc) => doc.data().resolution === undefined)
+                        .map((doc) => ({ id: doc.id, ...doc.data(), legacy: true }));
+                    show();
+                })
+                .catch((error) => {
+                    console.error("Error fetching older traffic data:", error);
+                });
+        }
+
+        return () => {
+            active = false;
+            unsub();
+        };
+    }, [resolution]);
 
     // Ensure unique locations for pins
     const uniqueLocations = Object.values(
@@ -53,7 +94,9 @@ function TrafficDashboard() {
     const chartData = traffic.map((t) => {
         let formattedTime = "Unknown";
         if (t.time?.toDate) {
-            formattedTime = t.time.toDate().toLocaleDateString();
+            formattedTime = resolution < 3600
+                ? t.time.toDate().toLocaleTimeString()
+                : t.time.toDate().toLocaleDateString();
         }
         return { time: formattedTime, density: t.density || 0 };
     });
@@ -79,6 +122,7 @@ function TrafficDashboard() {
                                     <br />
                                     <span className="density">
                                         Density: {entry.density ?? "N/A"}
+                                        {entry.legacy && " (30 min snapshot)"}
                                     </span>
                                 </li>
                             ))}
@@ -86,6 +130,17 @@ function TrafficDashboard() {
                     </div>
 
                     <div className="charts-container">
+                        <div className="tabs">
+                            {[[60, "1 min"], [900, "15 min"], [3600, "1 h"]].map(([seconds, label]) => (
+                                <button
+                                    key={seconds}
+                                    onClick={() => setResolution(seconds)}
+                                    className={resolution === seconds ? "active" : ""}
+                                >
+                                    {label}
+                                </button>
+                            ))}
+                        </div>
                         <div className="tabs">
                             <button
                                 onClick={() => setActiveTab("line")}